@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+
+import math
+import random
+import time
+
+from common import distance_function
+from tour import ArrayTour
+from local_search import EPS, OR_OPT_MAX, SearchStats, or_opt
+
+#時間を指定しなかったときの焼きなましの時間（秒）
+DEFAULT_TIME_LIMIT = 10.0
+
+#温度の自動調整：平均的な悪化移動を最初はP_START、最後はP_ENDの確率で受け入れる温度にする
+#（ランダムな移動の平均的な悪化量は局所最適解付近の移動よりずっと大きいので、P_ENDはかなり小さくする）
+P_START = 0.1
+P_END = 1e-9
+#温度を決めるためにサンプリングする移動の数
+CALIBRATION_SAMPLES = 2000
+#この回数ごとに経過時間を見て温度を更新する
+CHECK_INTERVAL = 500
+#Or-opt移動を選ぶ確率（残りは2-opt移動）
+OR_OPT_RATE = 0.3
+
+
+"""
+近傍リストからランダムに移動を1つ選んで、経路長の変化をO(1)で計算する関数
+2-opt移動：都市aとその近傍cについて辺(a,next(a)),(c,next(c))を(a,c),(next(a),next(c))に入れ替える
+Or-opt移動：aから始まる長さ1～OR_OPT_MAXの区間を、近傍cの隣の辺に（向きは良い方で）差し込む
+引数　tour：ArrayTour, d:関数, neighbors:二次元配列, rng:random.Random
+返り値　(経路長の変化, 移動を適用する関数, 引数のタプル)、選べなかったらNone
+"""
+def sample_move(tour, d, neighbors, rng):
+    N = len(tour)
+    a = rng.randrange(N)
+    near = neighbors[a]
+    c = near[rng.randrange(len(near))]
+
+    if rng.random() >= OR_OPT_RATE or N < OR_OPT_MAX + 4:
+        b, e = tour.next(a), tour.next(c)
+        if c == b or e == a:
+            return None
+        delta = d(a, c) + d(b, e) - d(a, b) - d(c, e)
+        return delta, tour.two_opt_move, (a, b, c, e)
+
+    #aから始まる区間s1..sLを取り出して、cの前後どちらかの辺(x,y)に差し込む
+    s1 = sL = a
+    segment = [a]
+    for _ in range(rng.randrange(OR_OPT_MAX)):
+        sL = tour.next(sL)
+        segment.append(sL)
+    if c in segment:
+        return None
+    x, y = (c, tour.next(c)) if rng.random() < 0.5 else (tour.prev(c), c)
+    if x in segment or y in segment:
+        return None
+    p, n = tour.prev(s1), tour.next(sL)
+    removed = d(p, s1) + d(sL, n) - d(p, n) + d(x, y)
+    forward_added = d(x, s1) + d(sL, y)
+    backward_added = d(x, sL) + d(s1, y)
+    forward = forward_added <= backward_added
+    delta = min(forward_added, backward_added) - removed
+    return delta, tour.or_move, (s1, sL, x, y, forward)
+
+
+"""
+ランダムな移動の悪化量の平均から、最初と最後の温度を決める関数
+引数　tour：ArrayTour, d:関数, neighbors:二次元配列, rng:random.Random
+返り値　(最初の温度, 最後の温度)
+"""
+def calibrate_temperature(tour, d, neighbors, rng):
+    uphill = []
+    for _ in range(CALIBRATION_SAMPLES):
+        move = sample_move(tour, d, neighbors, rng)
+        if move is not None and move[0] > EPS:
+            uphill.append(move[0])
+    average = sum(uphill) / len(uphill) if uphill else 1.0
+    #exp(-average/T) = P となる温度T
+    return -average / math.log(P_START), -average / math.log(P_END)
+
+
+"""
+近傍リストと時間指定を使った焼きなまし法
+
+近傍リストからランダムに2-opt/Or-opt移動を選び、経路長の変化をO(1)で計算して、
+短くなるなら必ず、長くなるなら確率exp(-変化量/温度)で受け入れる（expは長くなるときだけ計算する）
+温度は最初と最後の温度をランダムな移動の悪化量から自動で決め、
+経過時間の割合に応じて指数的に下げるので、time_limit秒でちょうど冷え切る
+最後に見つかった最短の経路にOr-optと2-optをかけて局所最適解にしてから返す
+引数　tour：配列, dist:二次元配列またはDistanceOracle, neighbors:二次元配列,
+　　　time_limit:float型（秒）, length:float型（tourの経路長、省略可）,
+　　　stats:SearchStats（省略可）, seed:int型（省略可）
+返り値　tour:配列, length:float型
+"""
+def simulated_annealing(tour, dist, neighbors, time_limit=DEFAULT_TIME_LIMIT,
+                        length=None, stats=None, seed=None):
+    N = len(tour)
+    if stats is None:
+        stats = SearchStats()
+    d = distance_function(dist)
+    if length is None:
+        length = sum(d(tour[i - 1], tour[i]) for i in range(N))
+    if N < 5:
+        return tour, length
+
+    start = time.perf_counter()
+    rng = random.Random(seed)
+    array_tour = ArrayTour(tour)
+    best_order, best_length = array_tour.tolist(), length
+
+    initial_t, final_t = calibrate_temperature(array_tour, d, neighbors, rng)
+    ratio = final_t / initial_t
+    temperature = initial_t
+
+    iterations = 0
+    while True:
+        iterations += 1
+        if iterations % CHECK_INTERVAL == 0:
+            progress = (time.perf_counter() - start) / time_limit
+            if progress >= 1:
+                break
+            temperature = initial_t * ratio ** progress
+            #最短の経路は毎回ではなくここでまとめて記録する（コピーにO(N)かかるので）
+            if length < best_length - EPS:
+                best_order, best_length = array_tour.tolist(), length
+
+        move = sample_move(array_tour, d, neighbors, rng)
+        if move is None:
+            continue
+        delta, apply, args = move
+        stats.evaluations += 1
+        if delta > 0 and rng.random() >= math.exp(-delta / temperature):
+            continue
+        apply(*args)
+        length += delta
+        stats.applied += 1
+
+    if length < best_length - EPS:
+        best_order, best_length = array_tour.tolist(), length
+
+    #焼きなましで最後に残った小さな改善を拾う
+    tour[:] = best_order
+    return or_opt(tour, dist, neighbors, length=best_length)
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import resource
+import statistics
+import contextlib
+import multiprocessing
+
+import numpy as np
+
+from common import read_input, read_input_array
+from output_verifier import discover_challenges, permutation_error, tour_length
+
+#時間指定できるsolverの制限時間（秒）
+DEFAULT_TIME_LIMIT = 5.0
+#1つのsolver・Challengeを何回実行するか
+DEFAULT_REPEAT = 3
+#ベースラインより何割遅く（メモリが多く）なったら遅くなったとみなすか
+DEFAULT_TOLERANCE = 0.10
+#ベースラインより何割経路が長くなったら悪くなったとみなすか
+DEFAULT_LENGTH_TOLERANCE = 0.001
+#制限時間で打ち切るsolverは同じ乱数の種でも経路長が実行ごとに変わるので、こちらの割合で比べる
+DEFAULT_BUDGET_LENGTH_TOLERANCE = 0.02
+#これより短い時間の差は測定の誤差とみなして比べない（秒）
+MIN_TIME = 0.05
+#これより小さいピークメモリの差は比べない（KB）
+MIN_RSS_KB = 1024
+
+
+"""
+tsp_univ_assignment.solveのアルゴリズムalgorithm_numを実行して経路を返す関数を作る関数
+"""
+def _algorithm(algorithm_num):
+    def run(cities, time_limit, seed):
+        import tsp_univ_assignment
+        return tsp_univ_assignment.solve(cities, algorithm_num, time_limit, seed=seed)[0]
+    return run
+
+
+def _solver_greedy(cities, time_limit, seed):
+    import solver_greedy
+    return solver_greedy.solve(cities)
+
+
+def _greedy_opt2(cities, time_limit, seed):
+    import greedy_opt2
+    return greedy_opt2.solve(cities, time_limit=time_limit)
+
+
+def _greedy_opt2_revised(cities, time_limit, seed):
+    import greedy_opt2_revised
+    return greedy_opt2_revised.solve(cities, 4, time_limit=time_limit)
+
+
+def _greedy_opt2_advanced(cities, time_limit, seed):
+    import greedy_opt2_advanced
+    return greedy_opt2_advanced.solve(cities, 4, 3, time_limit=time_limit)
+
+
+#ベンチマークするsolver：名前→(経路を返す関数(cities, time_limit, seed), 実行する最大の都市数,
+#　　　　　　　　　　　　　　　制限時間まで探索を続けるか)
+#（seedはrandomとnp.randomにも設定してから呼ぶ。自分で乱数生成器を作るsolverにはseedを渡す）
+#（全探索やHeld-Karp法のように大きなChallengeでは終わらないものは都市数で絞る）
+#（焼きなまし法のように制限時間で打ち切るものは、どこまで進むかがマシンの速さで変わるので、
+#　compareで経路長をDEFAULT_BUDGET_LENGTH_TOLERANCEの割合で比べる）
+SOLVERS = {
+    'greedy': (_solver_greedy, None, False),
+    'greedy_opt2': (_greedy_opt2, None, False),
+    'greedy_opt2_revised': (_greedy_opt2_revised, None, True),
+    'greedy_opt2_advanced': (_greedy_opt2_advanced, None, True),
+    'alg1': (_algorithm(1), 8, False),
+    'alg2': (_algorithm(2), 8, False),
+    'alg3': (_algorithm(3), None, False),
+    'alg4': (_algorithm(4), 512, False),
+    'alg5': (_algorithm(5), 512, False),
+    'alg6': (_algorithm(6), None, False),
+    'alg7': (_algorithm(7), None, False),
+    'alg8': (_algorithm(8), None, False),
+    'alg9': (_algorithm(9), None, True),
+    'alg10': (_algorithm(10), 16, False),
+    'alg11': (_algorithm(11), 64, True),
+}
+
+
+"""
+子プロセスで1回分を実行して測定結果をconnに送る関数
+実行ごとに新しいプロセスにするので、ピークメモリ（ru_maxrss）がほかの実行の影響を受けない
+solverが作ったワーカープロセスの分はCPU時間とピークメモリにRUSAGE_CHILDRENとして加える
+solverの表示は捨てる
+"""
+def _measure(conn, name, challenge_number, seed, time_limit):
+    try:
+        random.seed(seed)
+        np.random.seed(seed)
+        cities = read_input(f'input_{challenge_number}.csv')
+        solver = SOLVERS[name][0]
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            cpu_start = time.process_time()
+            wall_start = time.perf_counter()
+            tour = solver(cities, time_limit, seed)
+            wall = time.perf_counter() - wall_start
+            cpu = time.process_time() - cpu_start
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        cpu += children.ru_utime + children.ru_stime
+        peak_rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, children.ru_maxrss)
+        conn.send({'wall': wall, 'cpu': cpu, 'peak_rss_kb': peak_rss,
+                   'tour': np.asarray(tour, dtype=np.int64)})
+    except BaseException as e:
+        conn.send({'error': f'{type(e).__name__}: {e}'})
+    finally:
+        conn.close()
+
+
+"""
+solver nameをChallenge challenge_numberで1回実行して測定結果を返す関数
+引数　name:str型, challenge_number:int型, seed:int型, time_limit:float型
+返り値　辞書（wall, cpu:秒, peak_rss_kb:KB, length:経路長、失敗したらerror）
+"""
+def run_once(name, challenge_number, seed, time_limit):
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(
+        target=_measure, args=(sender, name, challenge_number, seed, time_limit))
+    process.start()
+    sender.close()
+    try:
+        result = receiver.recv()
+    except EOFError:
+        result = {'error': 'solver process died'}
+    process.join()
+
+    tour = result.pop('tour', None)
+    if tour is not None:
+        xy = read_input_array(f'input_{challenge_number}.csv')
+        error = permutation_error(tour, len(xy))
+        if error is None:
+            result['length'] = tour_length(xy, tour)
+        else:
+            result['error'] = f'invalid tour: {error}'
+    return result
+
+
+"""
+solverとChallengeの組ごとにrepeat回実行して、全実行の結果と組ごとのまとめを返す関数
+i回目（0から数える）の実行にはseed+iの乱数の種を使う
+時間とメモリは中央値、経路長は最短と中央値をまとめる
+引数　names:配列（solverの名前）, challenges:配列, repeat:int型, seed:int型, time_limit:float型
+返り値　runs:配列, summary:配列
+"""
+def run_benchmark(names, challenges, repeat=DEFAULT_REPEAT, seed=0, time_limit=DEFAULT_TIME_LIMIT):
+    runs = []
+    summary = []
+    for name in names:
+        max_n = SOLVERS[name][1]
+        for challenge_number in challenges:
+            N = len(read_input_array(f'input_{challenge_number}.csv'))
+            if max_n is not None and N > max_n:
+                continue
+            results = []
+            for i in range(repeat):
+                result = run_once(name, challenge_number, seed + i, time_limit)
+                result.update(solver=name, challenge=challenge_number, N=N, seed=seed + i)
+                runs.append(result)
+                results.append(result)
+            ok = [result for result in results if 'error' not in result]
+            entry = {'solver': name, 'challenge': challenge_number, 'N': N,
+                     'runs': len(results), 'errors': len(results) - len(ok)}
+            if ok:
+                entry.update(
+                    wall=statistics.median(result['wall'] for result in ok),
+                    cpu=statistics.median(result['cpu'] for result in ok),
+                    peak_rss_kb=statistics.median(result['peak_rss_kb'] for result in ok),
+                    best_length=min(result['length'] for result in ok),
+                    length=statistics.median(result['length'] for result in ok),
+                )
+            print(_format_entry(entry), flush=True)
+            summary.append(entry)
+    return runs, summary
+
+
+def _format_entry(entry):
+    head = f'{entry["solver"]:>22} {entry["N"]:>6}'
+    if 'wall' not in entry:
+        return f'{head}  failed ({entry["errors"]}/{entry["runs"]} runs)'
+    return (f'{head} {entry["wall"]:>9.3f}s {entry["cpu"]:>9.3f}s '
+            f'{entry["peak_rss_kb"] / 1024:>8.1f}MB {entry["length"]:>12.2f}'
+            + (f'  ({entry["errors"]} failed)' if entry['errors'] else ''))
+
+
+"""
+まとめsummaryをベースラインbaselineと比べて、悪くなったものを返す関数
+時間（wall, cpu）とピークメモリはtolerance、経路長はlength_tolerance（制限時間まで探索を続けるsolverは
+budget_length_tolerance）の割合より大きくなったら悪くなったとみなす（MIN_TIME・MIN_RSS_KBより小さい差は比べない）
+ベースラインでは成功していたのに失敗した組も報告する（ベースラインにない組は比べない）
+引数　summary:配列, baseline:配列, tolerance:float型, length_tolerance:float型, budget_length_tolerance:float型
+返り値　regressions:配列（文字列）
+"""
+def compare(summary, baseline, tolerance=DEFAULT_TOLERANCE, length_tolerance=DEFAULT_LENGTH_TOLERANCE,
+            budget_length_tolerance=DEFAULT_BUDGET_LENGTH_TOLERANCE):
+    reference = {(entry['solver'], entry['challenge']): entry for entry in baseline}
+    regressions = []
+    for entry in summary:
+        key = (entry['solver'], entry['challenge'])
+        old = reference.get(key)
+        if old is None or 'wall' not in old:
+            continue
+        label = f'{entry["solver"]} N={entry["N"]}'
+        if 'wall' not in entry:
+            regressions.append(f'{label}: failed, baseline succeeded')
+            continue
+        budgeted = entry['solver'] in SOLVERS and SOLVERS[entry['solver']][2]
+        length_limit = budget_length_tolerance if budgeted else length_tolerance
+        for metric, limit, floor in (('wall', tolerance, MIN_TIME), ('cpu', tolerance, MIN_TIME),
+                                     ('peak_rss_kb', tolerance, MIN_RSS_KB), ('length', length_limit, 0)):
+            if entry[metric] > old[metric] * (1 + limit) and entry[metric] - old[metric] > floor:
+                regressions.append(f'{label}: {metric} {old[metric]:.6g} -> {entry[metric]:.6g} '
+                                   f'(+{entry[metric] / old[metric] - 1:.1%})')
+    return regressions
+
+
+def _environment():
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the solvers on every input_*.csv.')
+    parser.add_argument('solvers', nargs='*', help=f'solvers to run (default: all of {", ".join(SOLVERS)})')
+    parser.add_argument('--challenges', type=int, nargs='+', help='challenge numbers (default: all present)')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--time-limit', type=float, default=DEFAULT_TIME_LIMIT)
+    parser.add_argument('--output', default='benchmark_results.json', help='JSON results file')
+    parser.add_argument('--baseline', help='results file to compare against')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='allowed relative increase in time and memory')
+    parser.add_argument('--length-tolerance', type=float, default=DEFAULT_LENGTH_TOLERANCE,
+                        help='allowed relative increase in tour length')
+    parser.add_argument('--budget-length-tolerance', type=float, default=DEFAULT_BUDGET_LENGTH_TOLERANCE,
+                        help='allowed relative increase in tour length for solvers that run to the time limit')
+    args = parser.parse_args()
+
+    names = args.solvers or list(SOLVERS)
+    unknown = [name for name in names if name not in SOLVERS]
+    if unknown:
+        parser.error(f'unknown solver: {", ".join(unknown)}')
+    challenges = args.challenges or discover_challenges()
+
+    print(f'{"solver":>22} {"N":>6} {"wall":>10} {"cpu":>10} {"peak RSS":>10} {"length":>12}')
+    runs, summary = run_benchmark(names, challenges, args.repeat, args.seed, args.time_limit)
+    results = {
+        'environment': _environment(),
+        'settings': {'repeat': args.repeat, 'seed': args.seed, 'time_limit': args.time_limit},
+        'runs': runs,
+        'summary': summary,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+        f.write('\n')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(summary, baseline['summary'], args.tolerance, args.length_tolerance,
+                              args.budget_length_tolerance)
+        print()
+        if regressions:
+            print(f'{len(regressions)} regressions against {args.baseline}:')
+            for regression in regressions:
+                print('  ' + regression)
+            return 1
+        print(f'no regressions against {args.baseline}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import math
+import time
+import signal
+import tempfile
+
+from common import dump_tour, file_mode
+
+#途中の最短経路をファイルに書き出す間隔（秒）
+CHECKPOINT_INTERVAL = 5.0
+
+
+"""
+経路をファイルに書き出す関数
+同じフォルダの一時ファイルに書いてからos.replaceで置き換えるので、
+書いている途中で止まっても前の内容か新しい内容のどちらかが必ず残る
+引数　path:str型, tour:配列またはNumPyの整数配列
+"""
+def write_tour(path, tour):
+    directory, name = os.path.split(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=f'.{name}.', suffix='.tmp', dir=directory)
+    try:
+        #mkstempの一時ファイルは0o600で作られ、os.replaceしてもそのままなので権限を直しておく
+        os.fchmod(fd, file_mode(path))
+        with os.fdopen(fd, 'w') as f:
+            dump_tour(tour, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+"""
+探索の途中で見つかった最短の経路を覚えておき、ときどきファイルに書き出すクラス
+
+updateで今までより短い経路を渡すと覚えておき、前回書いてからinterval秒以上たっていれば書き出す
+（最初の経路はすぐに書き出す）。with文で使うと、終わったときと、
+SIGINT（Ctrl+C）・SIGTERMで止められたときに最後の最短の経路を書き出す
+引数　path:str型（出力ファイル）, interval:float型（秒）
+"""
+class Checkpoint:
+
+    def __init__(self, path, interval=CHECKPOINT_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self.tour = None
+        self.length = math.inf
+        self.dirty = False
+        self.last_write = -math.inf
+        self._pid = os.getpid()
+        self._previous = {}
+
+    """
+    経路tour（経路長length）が今までより短ければ覚えておき、必要なら書き出す関数
+    引数　tour:配列, length:float型
+    """
+    def update(self, tour, length):
+        if length >= self.length:
+            return
+        self.tour = list(tour)
+        self.length = length
+        self.dirty = True
+        if time.time() - self.last_write >= self.interval:
+            self.flush()
+
+    """
+    まだ書き出していない最短の経路があれば書き出す関数
+    """
+    def flush(self):
+        if self.dirty:
+            write_tour(self.path, self.tour)
+            self.dirty = False
+            self.last_write = time.time()
+
+    def __enter__(self):
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            self._previous[signum] = signal.signal(signum, self._handle_signal)
+        return self
+
+    def __exit__(self, *exc_info):
+        for signum, handler in self._previous.items():
+            signal.signal(signum, handler)
+        self._previous.clear()
+        self.flush()
+        return False
+
+    def _handle_signal(self, signum, frame):
+        #forkしたワーカープロセスにもハンドラが引き継がれるが、書き出すのは元のプロセスだけ
+        if os.getpid() != self._pid:
+            signal.signal(signum, signal.SIG_DFL)
+            os.kill(os.getpid(), signum)
+            return
+        self.flush()
+        if self.tour is not None:
+            print(f'signal {signum}: wrote the best tour so far (length {self.length}) to {self.path}',
+                  file=sys.stderr)
+        raise SystemExit(128 + signum)
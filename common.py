@@ -1,10 +1,97 @@
+import math
+import os
+import sys
+import stat
+import tempfile
+from collections import OrderedDict
+
+import numpy as np
+
+# Above this many cities solvers use a DistanceOracle instead of a full matrix.
+MATRIX_LIMIT = 4096
+# Cities per write when a tour is streamed to a file.
+TOUR_CHUNK = 65536
+
+
 def read_input(filename):
-    with open(filename) as f:
-        cities = []
-        for line in f.readlines()[1:]:  # Ignore the first line.
-            xy = line.split(',')
-            cities.append((float(xy[0]), float(xy[1])))
-        return cities
+    # List of (x, y) tuples, as the solvers expect. The coordinates come from
+    # read_input_array, so repeated runs on the same file skip the CSV parse.
+    # Note that this writes a <filename>.npy sidecar next to the CSV (e.g.
+    # input_5.csv.npy); it is ignored by git and safe to delete. Use
+    # read_input_array(filename, cache=False) to leave the directory as is.
+    xy = read_input_array(filename)
+    return list(zip(xy[:, 0].tolist(), xy[:, 1].tolist()))
+
+
+def read_input_array(filename, cache=True):
+    # Coordinates as an N x 2 float64 array. The CSV is parsed in bulk by
+    # NumPy and saved to a .npy sidecar next to it; later calls memory-map the
+    # sidecar read-only, so processes reading the same input share its pages.
+    # The sidecar's first row holds the CSV's (size, mtime) it was built
+    # from, and it is rebuilt whenever the CSV changes.
+    if cache:
+        # Stat before parsing: if the CSV is rewritten while it is being
+        # parsed, the sidecar gets the old key and is rebuilt next time
+        # instead of pairing stale coordinates with the new file.
+        key = _cache_key(filename)
+        try:
+            cached = np.load(filename + '.npy', mmap_mode='r')
+            if cached.ndim == 2 and cached.shape[1] == 2 and tuple(cached[0]) == key:
+                return cached[1:]
+        except (OSError, ValueError):
+            pass
+
+    xy = np.loadtxt(filename, delimiter=',', skiprows=1, usecols=(0, 1), dtype=np.float64, ndmin=2)
+    xy = xy.reshape(-1, 2)
+    if cache:
+        try:
+            _write_cache(filename, xy, key)
+        except OSError:
+            # A read-only directory only costs the cache, not the input.
+            pass
+    return xy
+
+
+def write_input_cache(filename, xy):
+    # Save the .npy sidecar read_input_array looks for, for coordinates xy
+    # that are known to match the CSV filename as it is now, e.g. because
+    # they were just written to it. Skips the CSV parse on the first read.
+    _write_cache(filename, xy, _cache_key(filename))
+
+
+def _write_cache(filename, xy, key):
+    _save_atomic(filename + '.npy', np.vstack([key, xy]))
+
+
+def _cache_key(filename):
+    stat = os.stat(filename)
+    return (float(stat.st_size), stat.st_mtime)
+
+
+def _save_atomic(path, array):
+    # Write to a temporary file in the same directory and rename it over
+    # path, so a concurrent reader never maps a half-written sidecar.
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.npy.tmp')
+    try:
+        # mkstemp creates the file 0600 and os.replace would keep that.
+        os.fchmod(fd, file_mode(path))
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, array)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def file_mode(path):
+    # Mode to give a file written via a temporary file and os.replace: the
+    # existing file's mode, or what open() would create under the umask.
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
 
 
 def format_tour(tour):
@@ -12,4 +99,110 @@ def format_tour(tour):
 
 
 def print_tour(tour):
-    print(format_tour(tour))
+    dump_tour(tour, sys.stdout)
+
+
+def dump_tour(tour, f, chunk_size=TOUR_CHUNK):
+    # Write the tour to the text file f in the same format as
+    # format_tour(tour) + '\n', but chunk_size cities at a time so peak
+    # memory stays O(chunk_size) instead of one string for the whole tour.
+    # tour may be a list or a NumPy integer array.
+    f.write('index\n')
+    for start in range(0, len(tour), chunk_size):
+        chunk = tour[start:start + chunk_size]
+        if isinstance(chunk, np.ndarray):
+            chunk = chunk.tolist()
+        f.write('\n'.join(map(str, chunk)))
+        f.write('\n')
+
+
+def load_tour(filename, max_rows=None):
+    # Read a tour written by dump_tour straight into an int64 array, without
+    # a list of lines in between. max_rows limits how many cities are read.
+    with open(filename) as f:
+        header = f.readline().strip()
+        if header != 'index':
+            raise ValueError(f'{filename}: expected header "index", got {header!r}')
+        return np.loadtxt(f, dtype=np.int64, ndmin=1, max_rows=max_rows)
+
+
+def distance_matrix(cities, dtype=np.float64, block_rows=512, out=None):
+    # Build the N x N Euclidean distance matrix with NumPy broadcasting.
+    # Rows are filled in blocks so the temporaries stay O(block_rows * N)
+    # instead of O(N^2), and float32 halves the size of the result. With
+    # out, fill that N x N array (e.g. a view of shared memory) instead.
+    xy = np.asarray(cities, dtype=np.float64).reshape(-1, 2)
+    x, y = xy[:, 0], xy[:, 1]
+    N = len(xy)
+    dist = np.empty((N, N), dtype=dtype) if out is None else out
+    for start in range(0, N, block_rows):
+        stop = min(start + block_rows, N)
+        dx = x[start:stop, np.newaxis] - x[np.newaxis, :]
+        dy = y[start:stop, np.newaxis] - y[np.newaxis, :]
+        dx *= dx
+        dy *= dy
+        dx += dy
+        dist[start:stop] = np.sqrt(dx, out=dx)
+    return dist
+
+
+class DistanceOracle:
+    # Distances computed on demand from the coordinates, for instances where
+    # an N x N matrix does not fit. dist[i][j] works like the list-of-lists
+    # matrix by materializing row i into a small LRU cache, which suits row
+    # scans such as greedy(). dist(i, j) computes a single entry without
+    # touching the cache, which suits the random pairs looked up by 2-opt.
+    def __init__(self, cities, cache_rows=32):
+        self.xy = np.asarray(cities, dtype=np.float64).reshape(-1, 2)
+        self.x = self.xy[:, 0].tolist()
+        self.y = self.xy[:, 1].tolist()
+        self.cache_rows = max(1, cache_rows)
+        self._rows = OrderedDict()
+        self._last_i = None
+        self._last_row = None
+
+    def __len__(self):
+        return len(self.x)
+
+    def __call__(self, i, j):
+        dx = self.x[i] - self.x[j]
+        dy = self.y[i] - self.y[j]
+        return math.sqrt(dx * dx + dy * dy)
+
+    def __getitem__(self, i):
+        # greedy() looks up the same row once per candidate city.
+        if i == self._last_i:
+            return self._last_row
+        row = self._rows.get(i)
+        if row is None:
+            d = self.xy - self.xy[i]
+            d *= d
+            row = np.sqrt(d[:, 0] + d[:, 1]).tolist()
+            self._rows[i] = row
+            if len(self._rows) > self.cache_rows:
+                self._rows.popitem(last=False)
+        else:
+            self._rows.move_to_end(i)
+        self._last_i = i
+        self._last_row = row
+        return row
+
+    def tour_length(self, tour):
+        xy = self.xy[np.asarray(tour, dtype=np.intp)]
+        d = xy - np.roll(xy, -1, axis=0)
+        d *= d
+        return float(np.sqrt(d[:, 0] + d[:, 1]).sum())
+
+
+def distance_function(dist):
+    # d(i, j) for either a list-of-lists matrix or a DistanceOracle.
+    if isinstance(dist, DistanceOracle):
+        return dist
+    return lambda i, j: dist[i][j]
+
+
+def distance_table(cities, matrix_limit=MATRIX_LIMIT, cache_rows=32):
+    # Full list-of-lists matrix for small instances, O(N) memory otherwise.
+    if len(cities) <= matrix_limit:
+        return distance_matrix(cities).tolist()
+    return DistanceOracle(cities, cache_rows)
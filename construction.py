@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+
+import itertools
+
+import numpy as np
+
+from spatial import GridIndex, neighbor_lists
+
+
+"""
+最近傍法（貪欲法）　start都市から、まだ訪れていない都市の中で最も近い都市へ順につなぐ関数
+
+未訪問の都市を格子状の空間インデックスに入れておき、訪れた都市は取り除くので、
+毎回すべての未訪問都市との距離を比べる（全体でO(N^2)）代わりに近くのセルだけを調べればよい
+距離が同じ都市がなければ、距離行列で最も近い都市を選ぶ場合と同じ経路になる
+引数　cities:配列, start:int型
+返り値　tour:配列
+"""
+def nearest_neighbor(cities, start=0):
+    index = GridIndex(cities)
+    N = len(index)
+    index.remove(start)
+    tour = [start]
+    current_city = start
+    for _ in range(N - 1):
+        current_city = index.nearest(current_city)
+        index.remove(current_city)
+        tour.append(current_city)
+    return tour
+
+
+"""
+union-find（素集合データ構造）で都市xの属する集合の代表を返す関数（経路を半分に縮めながらたどる）
+引数　parent:配列, x:int型
+返り値　int型
+"""
+def _find(parent, x):
+    while parent[x] != x:
+        parent[x] = parent[parent[x]]
+        x = parent[x]
+    return x
+
+
+"""
+つないだ辺でできた道（断片）を、端点から最も近い別の断片の端点へ順につないで巡回路にする関数
+端点だけを空間インデックスに残し、たどり終えた断片の端点は取り除く
+引数　cities:配列, adjacent:二次元配列（各都市につないだ都市、0～2個）
+返り値　tour:配列
+"""
+def _join_fragments(cities, adjacent):
+    index = GridIndex(cities)
+    N = len(index)
+    for city in range(N):
+        if len(adjacent[city]) == 2:
+            index.remove(city)
+
+    #都市0を含む断片の端点から始める
+    end = 0
+    prev = -1
+    while len(adjacent[end]) == 2:
+        nxt = adjacent[end][0] if adjacent[end][0] != prev else adjacent[end][1]
+        prev, end = end, nxt
+    tour = []
+    while end >= 0:
+        #端点endから断片の反対の端点までたどる
+        index.remove(end)
+        prev, city = -1, end
+        while True:
+            tour.append(city)
+            nxt = [c for c in adjacent[city] if c != prev]
+            if not nxt:
+                break
+            prev, city = city, nxt[0]
+        if city != end:
+            index.remove(city)
+        end = index.nearest(city)
+    return _rotate(tour)
+
+
+"""
+巡回路を都市0から始まるように回す関数
+"""
+def _rotate(tour, start=0):
+    i = tour.index(start)
+    return tour[i:] + tour[:i]
+
+
+"""
+近傍リストの辺(i,j)（i<j）を重複なく集めて、短い順（同じ長さなら番号順）に並べる関数
+引数　xy:二次元配列（NumPy、座標）, neighbors:二次元配列
+返り値　(i,j)のタプルの配列
+"""
+def _candidate_edges(xy, neighbors):
+    N = len(xy)
+    a = np.repeat(np.arange(N), [len(near) for near in neighbors])
+    b = np.fromiter(itertools.chain.from_iterable(neighbors), dtype=np.intp, count=len(a))
+    a, b = np.minimum(a, b), np.maximum(a, b)
+    edges = np.unique(a * N + b)
+    a, b = edges // N, edges % N
+    d = xy[a] - xy[b]
+    d *= d
+    order = np.argsort(d[:, 0] + d[:, 1], kind='stable')
+    return list(zip(a[order].tolist(), b[order].tolist()))
+
+
+"""
+貪欲辺法（greedy edge matching）　短い辺から順に、次数が2を超えず部分巡回路もできないなら採用する関数
+
+候補の辺は各都市の近傍リストの辺だけにして長さでソートし、部分巡回路のチェックはunion-findで行う
+候補の辺で最後までつながらなかった断片は、端点どうしを最近傍法と同じようにつなぐ
+最近傍法より最後に長い辺が残りにくいので、2-optなどの局所探索が速く収束する
+引数　cities:配列, neighbors:二次元配列（近傍リスト、省略したら作る）
+返り値　tour:配列
+"""
+def greedy_edge(cities, neighbors=None):
+    xy = np.asarray(cities, dtype=np.float64).reshape(-1, 2)
+    N = len(xy)
+    if N <= 3:
+        return list(range(N))
+    if neighbors is None:
+        neighbors = neighbor_lists(cities)
+
+    adjacent = [[] for _ in range(N)]
+    parent = list(range(N))
+    joined = 0
+    for i, j in _candidate_edges(xy, neighbors):
+        if len(adjacent[i]) == 2 or len(adjacent[j]) == 2:
+            continue
+        ri, rj = _find(parent, i), _find(parent, j)
+        if ri == rj:
+            continue
+        parent[ri] = rj
+        adjacent[i].append(j)
+        adjacent[j].append(i)
+        joined += 1
+        if joined == N - 1:
+            break
+    return _join_fragments(cities, adjacent)
+
+
+"""
+ヒルベルト曲線の順番　平面を埋め尽くす曲線（ヒルベルト曲線）に沿った順に都市を並べる関数
+曲線上で近い点は平面上でも近いので、ソート1回（O(N log N)）でそれなりの経路になる
+引数　cities:配列, order:int型（平面を2^order×2^orderのマスに分ける）
+返り値　tour:配列
+"""
+def hilbert_curve(cities, order=16):
+    xy = np.asarray(cities, dtype=np.float64).reshape(-1, 2)
+    N = len(xy)
+    if N <= 3:
+        return list(range(N))
+    side = 1 << order
+    low = xy.min(axis=0)
+    scale = (side - 1) / max(float((xy.max(axis=0) - low).max()), 1e-9)
+    x = ((xy[:, 0] - low[0]) * scale).astype(np.int64)
+    y = ((xy[:, 1] - low[1]) * scale).astype(np.int64)
+
+    #マス(x,y)の曲線上の番号dを上の桁から1ビットずつ求める（全都市まとめて計算する）
+    d = np.zeros(N, dtype=np.int64)
+    s = side >> 1
+    while s > 0:
+        rx = (x & s) > 0
+        ry = (y & s) > 0
+        d += s * s * ((3 * rx) ^ ry)
+        #次の桁のために象限を回転・反転する
+        flip = ~ry & rx
+        x = np.where(flip, side - 1 - x, x)
+        y = np.where(flip, side - 1 - y, y)
+        x, y = np.where(~ry, y, x), np.where(~ry, x, y)
+        s >>= 1
+    return _rotate(np.lexsort((np.arange(N), d)).tolist())
+
+
+"""
+最小全域木の2倍の木を使う方法（double tree）　最小全域木を深さ優先でたどった順に都市を並べる関数
+（三角不等式から経路長は最適経路長の2倍以下になる。Christofides法のマッチングを省いたもの）
+最小全域木は近傍リストの辺だけを使ってクラスカル法（短い辺から、union-findで閉路を作らないものを採用）で作る。
+近傍リストの辺だけでは全体がつながらないときは、1つの木をたどり終えたら最も近い未訪問の都市に移る
+引数　cities:配列, neighbors:二次元配列（近傍リスト、省略したら作る）
+返り値　tour:配列
+"""
+def double_tree(cities, neighbors=None):
+    xy = np.asarray(cities, dtype=np.float64).reshape(-1, 2)
+    N = len(xy)
+    if N <= 3:
+        return list(range(N))
+    if neighbors is None:
+        neighbors = neighbor_lists(cities)
+
+    adjacent = [[] for _ in range(N)]
+    parent = list(range(N))
+    joined = 0
+    for i, j in _candidate_edges(xy, neighbors):
+        ri, rj = _find(parent, i), _find(parent, j)
+        if ri == rj:
+            continue
+        parent[ri] = rj
+        adjacent[i].append(j)
+        adjacent[j].append(i)
+        joined += 1
+        if joined == N - 1:
+            break
+
+    #都市0から深さ優先（行きがけ順）でたどる
+    index = GridIndex(cities)
+    visited = [False] * N
+    tour = []
+    city = 0
+    while city >= 0:
+        stack = [city]
+        while stack:
+            city = stack.pop()
+            if visited[city]:
+                continue
+            visited[city] = True
+            index.remove(city)
+            tour.append(city)
+            stack.extend(c for c in reversed(adjacent[city]) if not visited[c])
+        city = index.nearest(city)
+    return tour
+
+
+#名前で選べる経路の作り方（どれも cities を受け取って都市0から始まる経路を返す）
+CONSTRUCTORS = {
+    'nearest_neighbor': nearest_neighbor,
+    'greedy_edge': greedy_edge,
+    'hilbert': hilbert_curve,
+    'double_tree': double_tree,
+}
+#近傍リストを使う作り方（作ってあれば渡すと作り直さずに済む）
+USES_NEIGHBORS = {'greedy_edge', 'double_tree'}
+
+
+"""
+名前で選んだ方法で最初の経路を作る関数
+引数　cities:配列, method:str型（CONSTRUCTORSのキー）, neighbors:二次元配列（近傍リスト、省略可）
+返り値　tour:配列
+"""
+def construct(cities, method='nearest_neighbor', neighbors=None):
+    if method not in CONSTRUCTORS:
+        raise ValueError(f'unknown construction method {method!r} '
+                         f'(choose from {", ".join(CONSTRUCTORS)})')
+    if method in USES_NEIGHBORS:
+        return CONSTRUCTORS[method](cities, neighbors)
+    return CONSTRUCTORS[method](cities)
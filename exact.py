@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+
+import math
+import time
+
+import numpy as np
+
+from common import MATRIX_LIMIT, DistanceOracle
+from local_search import EPS, two_opt_neighbors, or_opt
+
+#Held-Karp法で使ってよいメモリの上限（バイト）。これを超える大きさの問題は解かない
+HELD_KARP_MEMORY_LIMIT = 1 << 30
+#分枝限定法で下界（Held-Karpの下界）を求めるときの劣勾配法の反復回数（最初のノード／それ以外のノード）
+BNB_ROOT_ITERATIONS = 1000
+BNB_NODE_ITERATIONS = 100
+
+
+"""
+Held-Karp法で必要になるメモリ（バイト）を見積もる関数
+（dp表がfloat64、復元用の表がint8で、どちらも 2^(N-1) × (N-1) 要素）
+引数　N:int型
+返り値　int型
+"""
+def held_karp_memory(N):
+    M = max(N - 1, 0)
+    return (1 << M) * M * (8 + 1)
+
+
+"""
+Held-Karp法（bit DP）で最短経路を厳密に求める関数
+
+dp[S][j] = 都市0から出発して、集合S（都市1～N-1の部分集合をビットで表したもの）の都市を
+すべて通って都市j+1で終わる経路の最短の長さ
+とすると dp[S][j] = min_i (dp[S-{j}][i] + dist[i+1][j+1]) になる。
+Sの要素数ごとに、同じ要素数の集合をまとめてNumPyで計算するので、
+全探索（(N-1)!通り）と違い O(2^N × N^2) で解ける（N=16なら1秒かからない）
+必要なメモリが memory_limit を超えるときは ValueError を出す
+引数　dist:二次元配列, memory_limit:int型（バイト）
+返り値　tour:配列, length:float型
+"""
+def held_karp(dist, memory_limit=HELD_KARP_MEMORY_LIMIT):
+    #大きすぎる問題はN×Nの距離行列を作る前に断る
+    N = len(dist)
+    needed = held_karp_memory(N)
+    if needed > memory_limit:
+        #Nが大きいとfloatに直せないほど大きくなるので、そのときは2の何乗かで表す
+        size = f'{needed / 2**20:.0f} MiB' if needed < 1 << 100 else f'2^{math.log2(needed):.0f} bytes'
+        raise ValueError(f'Held-Karp for N={N} needs about {size} '
+                         f'(limit {memory_limit / 2**20:.0f} MiB)')
+
+    D = np.asarray(dist, dtype=np.float64)
+    if N <= 3:
+        tour = list(range(N))
+        return tour, float(sum(D[tour[i - 1], tour[i]] for i in range(N)))
+
+    #都市0以外の都市（M個）だけを集合で表す。ビットjが都市j+1
+    M = N - 1
+    D1 = D[1:, 1:]
+    full = (1 << M) - 1
+
+    dp = np.full((1 << M, M), np.inf)
+    parent = np.full((1 << M, M), -1, dtype=np.int8)
+    bits = 1 << np.arange(M)
+    dp[bits, np.arange(M)] = D[0, 1:]
+
+    #各集合の要素数
+    masks = np.arange(1 << M)
+    counts = np.zeros(1 << M, dtype=np.int8)
+    for j in range(M):
+        counts += (masks >> j) & 1
+
+    for k in range(2, M + 1):
+        layer = masks[counts == k]
+        for j in range(M):
+            S = layer[(layer >> j) & 1 == 1]
+            #Sからjを除いた集合の、各都市iで終わる経路のあとに辺(i,j)をつなぐ
+            candidates = dp[S ^ (1 << j)] + D1[:, j]
+            best = candidates.argmin(axis=1)
+            dp[S, j] = candidates[np.arange(len(S)), best]
+            parent[S, j] = best
+
+    #最後に都市0に戻る
+    closing = dp[full] + D[1:, 0]
+    last = int(closing.argmin())
+    length = float(closing[last])
+
+    #parentをたどって経路を復元する
+    tour = []
+    S, j = full, last
+    while j >= 0:
+        tour.append(j + 1)
+        S, j = S ^ (1 << j), int(parent[S, j])
+    tour.append(0)
+    tour.reverse()
+    return tour, length
+
+
+"""
+距離行列Wの最小全域木の長さをプリム法で求める関数（NumPyで1点ずつ木に加える）
+引数　W:二次元配列（NumPy）
+返り値　cost:float型, parent:配列（木での各点の親。点0は根なので0）
+"""
+def _prim(W):
+    k = len(W)
+    in_tree = np.zeros(k, dtype=bool)
+    in_tree[0] = True
+    best = W[0].copy()
+    parent = np.zeros(k, dtype=np.intp)
+    cost = 0.0
+    for _ in range(k - 1):
+        v = int(np.where(in_tree, np.inf, best).argmin())
+        cost += best[v]
+        in_tree[v] = True
+        closer = (W[v] < best) & ~in_tree
+        parent[closer] = v
+        best = np.where(closer, W[v], best)
+    return cost, parent
+
+
+"""
+1-tree（都市0以外の最小全域木＋都市0から短い2本の辺）を作る関数
+引数　W:二次元配列（NumPy、辺の重み）
+返り値　edges:(端点の配列, 端点の配列), degree:配列（各都市の次数）
+"""
+def _one_tree(W):
+    N = len(W)
+    _, parent = _prim(W[1:, 1:])
+    a = np.concatenate((parent[1:] + 1, [0, 0]))
+    b = np.concatenate((np.arange(2, N), np.argsort(W[0, 1:])[:2] + 1))
+    degree = np.bincount(a, minlength=N) + np.bincount(b, minlength=N)
+    return (a, b), degree
+
+
+"""
+1-treeの下界を最大にするペナルティπを劣勾配法で求める関数（Held-Karpの下界）
+
+辺(i,j)の長さを D[i][j] + π[i] + π[j] に変えても最短経路は変わらず、経路長は 2Σπ だけ増えるので、
+1-treeの長さ - 2Σπ は任意のπで経路長の下界になる。次数が2より大きい都市のπを上げ、
+小さい都市のπを下げることでこの下界を最適経路長に近づける
+fixedを渡すと、fixed[i][j]=1の辺は必ず使い、-1の辺は使わない経路だけの下界を求める
+下界がupper以上になったら（その経路より短い経路はないので）途中で止める
+deadline（time.time()の時刻）を過ぎたときも、そこまでで最大の下界を返す
+引数　D:二次元配列（NumPy）, upper:float型（既知の経路長）, iterations:int型,
+　　　pi:配列（初期値、省略可）, fixed:二次元配列（NumPy、省略可）, deadline:float型（省略可）
+返り値　pi:配列, bound:float型（得られた最大の下界）, edges, degree（そのときの1-tree）
+"""
+def held_karp_penalties(D, upper, iterations=200, pi=None, fixed=None, deadline=None):
+    N = len(D)
+    pi = np.zeros(N) if pi is None else pi.copy()
+    #使う辺はとても短く、使わない辺は無限大にしてから1-treeを作る
+    forced_weight = -(D.max() * N + 1)
+    best = (pi, -np.inf, None, None)
+    step_scale = 2.0
+    stall = 0
+    for _ in range(iterations):
+        if deadline is not None and best[2] is not None and time.time() >= deadline:
+            break
+        W = D + pi[:, None] + pi[None, :]
+        if fixed is not None:
+            W = np.where(fixed == 1, forced_weight, np.where(fixed == -1, np.inf, W))
+        edges, degree = _one_tree(W)
+        if fixed is not None and ((fixed[edges] == -1).any()
+                                  or (fixed[edges] == 1).sum() * 2 != (fixed == 1).sum()):
+            #条件を満たす1-treeがない（使わない辺を使わないとつながらない、使う辺で部分巡回路ができている）
+            return pi, np.inf, edges, degree
+        bound = (D[edges] + pi[edges[0]] + pi[edges[1]]).sum() - 2 * pi.sum()
+        if bound > best[1] + 1e-9:
+            best = (pi.copy(), bound, edges, degree)
+            stall = 0
+        else:
+            stall += 1
+            if stall >= 10:
+                step_scale /= 2
+                stall = 0
+        subgradient = degree - 2
+        norm = (subgradient ** 2).sum()
+        if norm == 0 or bound >= upper - EPS:
+            #1-treeが巡回路になった（最適解）か、これ以上調べなくてよい
+            break
+        pi = pi + step_scale * (upper - bound) / norm * subgradient
+    return best
+
+
+"""
+辺を使う(1)/使わない(-1)と決めたあとに、決まったことから分かる辺を決める関数
+使う辺が2本ある都市の残りの辺は使わないことにする
+使う辺が3本以上ある都市や、使えそうな辺が2本ない都市があればFalseを返す
+引数　fixed:二次元配列（NumPy）
+返り値　bool型
+"""
+def _propagate(fixed):
+    changed = True
+    while changed:
+        forced = (fixed == 1).sum(axis=1)
+        usable = (fixed != -1).sum(axis=1)
+        if (forced > 2).any() or (usable < 2).any():
+            return False
+        full = (forced == 2) & (usable > 2)
+        changed = bool(full.any())
+        for v in np.flatnonzero(full):
+            free = fixed[v] == 0
+            free[v] = False
+            fixed[v, free] = -1
+            fixed[free, v] = -1
+    return True
+
+
+"""
+使う辺だけをたどって都市aから都市bに行けるかを返す関数（行けるなら辺(a,b)を使うと部分巡回路になる）
+引数　fixed:二次元配列（NumPy）, a,b:int型
+返り値　経路に含まれる都市の数（行けなければ0）
+"""
+def _forced_path(fixed, a, b):
+    prev, city, count = -1, a, 1
+    while True:
+        nxt = [c for c in np.flatnonzero(fixed[city] == 1) if c != prev]
+        if not nxt:
+            return 0
+        prev, city = city, nxt[0]
+        count += 1
+        if city == b:
+            return count
+
+
+"""
+1-treeの辺から巡回路（都市0から始まる配列）を作る関数
+"""
+def _tree_to_tour(edges, N):
+    adjacent = [[] for _ in range(N)]
+    for a, b in zip(*edges):
+        adjacent[a].append(int(b))
+        adjacent[b].append(int(a))
+    tour, prev = [0], -1
+    while len(tour) < N:
+        city = tour[-1]
+        nxt = adjacent[city][0] if adjacent[city][0] != prev else adjacent[city][1]
+        prev = city
+        tour.append(nxt)
+    return tour
+
+
+"""
+分枝限定法で最短経路を厳密に求める関数
+
+最初に近傍リストの2-opt/Or-optで作った経路を暫定解にする。
+探索の各ノードでは、ある辺を「使う」「使わない」と決めた経路の集まりについて、
+親ノードのπから劣勾配法を続けてHeld-Karpの下界（1-tree）を求め、下界が暫定解以上なら枝を刈る。
+1-treeがそのまま巡回路になっていればそれがこのノードの最短経路なので暫定解を更新する。
+そうでなければ、次数が3以上の都市につながる1-treeの辺を1本選んで「使わない」「使う」の2つに分ける
+（都市の順列を深さ優先で調べるのと違い、1-treeの下界は最適経路長の1%以内になることが多いので、
+64都市でもノード数が少なくて済む）
+time_limit秒を過ぎたらそこで打ち切って暫定解を返す（劣勾配法の途中でも止める）
+N×Nの距離行列を作る分枝限定法が扱えるのはMATRIX_LIMIT都市までで、
+それより大きい問題やDistanceOracleを渡したときは行列を作る前にValueErrorを出す
+引数　dist:二次元配列, initial_tour:配列（暫定解、省略可）, time_limit:float型（秒、省略可）
+返り値　tour:配列, length:float型, optimal:bool型（最後まで探索して最適だと証明できたか）
+"""
+def branch_and_bound(dist, initial_tour=None, time_limit=None):
+    if isinstance(dist, DistanceOracle) or len(dist) > MATRIX_LIMIT:
+        raise ValueError(f'branch and bound needs an N x N distance matrix '
+                         f'(N={len(dist)}, limit {MATRIX_LIMIT})')
+    D = np.asarray(dist, dtype=np.float64)
+    N = len(D)
+    if N <= 3:
+        tour = list(range(N))
+        return tour, float(sum(D[tour[i - 1], tour[i]] for i in range(N))), True
+
+    deadline = None if time_limit is None else time.time() + time_limit
+    Dl = D.tolist()
+
+    #暫定解：最近傍法＋近傍リストの2-opt/Or-opt
+    if initial_tour is None:
+        #同じ位置の都市があると自分が先頭に来るとは限らないので、自分を除いてから近い順に10個取る
+        order = np.argsort(D, axis=1, kind='stable').tolist()
+        neighbors = [[j for j in row if j != i][:10] for i, row in enumerate(order)]
+        initial_tour = _nearest_neighbor(Dl)
+        initial_tour, _ = two_opt_neighbors(initial_tour, Dl, neighbors, deadline=deadline)
+        initial_tour, _ = or_opt(initial_tour, Dl, neighbors, deadline=deadline)
+    first = initial_tour.index(0)
+    best_tour = initial_tour[first:] + initial_tour[:first]
+    best_length = sum(Dl[best_tour[i - 1]][best_tour[i]] for i in range(N))
+
+    fixed = np.zeros((N, N), dtype=np.int8)
+    np.fill_diagonal(fixed, -1)
+    pi, _, _, _ = held_karp_penalties(D, best_length, BNB_ROOT_ITERATIONS, deadline=deadline)
+    #(fixed, π)のスタック（深さ優先）
+    stack = [(fixed, pi)]
+    timed_out = False
+    while stack:
+        if deadline is not None and time.time() >= deadline:
+            timed_out = True
+            break
+        fixed, pi = stack.pop()
+        pi, bound, edges, degree = held_karp_penalties(D, best_length, BNB_NODE_ITERATIONS, pi, fixed,
+                                                       deadline)
+        if bound >= best_length - EPS:
+            continue
+        if (degree == 2).all():
+            best_tour, best_length = _tree_to_tour(edges, N), bound
+            continue
+
+        #次数が一番大きい都市につながる、まだ決めていない1-treeの辺を選ぶ
+        a, b = edges
+        free = fixed[edges] == 0
+        if not free.any():
+            continue
+        branch = np.flatnonzero(free)[np.argmax(np.maximum(degree[a], degree[b])[free])]
+        i, j = int(a[branch]), int(b[branch])
+
+        #「使う」の方を先に調べたいので後に積む
+        children = []
+        for value in (-1, 1):
+            child = fixed.copy()
+            child[i, j] = child[j, i] = value
+            if value == 1 and 0 < _forced_path(fixed, i, j) < N:
+                continue
+            if _propagate(child):
+                children.append((child, pi))
+        stack.extend(children)
+
+    best_length = sum(Dl[best_tour[i - 1]][best_tour[i]] for i in range(N))
+    return best_tour, best_length, not timed_out
+
+
+"""
+最近傍法　都市0から未訪問の最も近い都市へ順につなぐ関数
+引数　dist:二次元配列
+返り値　tour:配列
+"""
+def _nearest_neighbor(dist):
+    N = len(dist)
+    unvisited = set(range(1, N))
+    tour = [0]
+    while unvisited:
+        row = dist[tour[-1]]
+        nxt = min(unvisited, key=row.__getitem__)
+        unvisited.remove(nxt)
+        tour.append(nxt)
+    return tour
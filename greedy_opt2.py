@@ -1,15 +1,14 @@
 #!/usr/bin/env python3
 
 import sys
-import math
-import random
 import time
 
-from common import print_tour, read_input,format_tour
-
-
-def distance(city1, city2):
-    return math.sqrt((city1[0] - city2[0]) ** 2 + (city1[1] - city2[1]) ** 2)
+from common import read_input,distance_table,DistanceOracle
+from spatial import neighbor_lists
+from construction import construct
+from local_search import two_opt_neighbors, or_opt, lin_kernighan, SearchStats
+from checkpoint import Checkpoint
+from instrumentation import SolveStats, Profiler, pop_option
 
 
 """
@@ -18,105 +17,99 @@ tour内の頂点を結んだ全長を返す関数
 返り値　length:int型
 """
 def tour_length(tour, dist):
+    #距離行列の代わりにDistanceOracleが渡されたら座標からまとめて計算する
+    if isinstance(dist, DistanceOracle):
+        return dist.tour_length(tour)
+
     # 経路長を計算
     length = 0
-    for i in range(len(tour)+1):
+    for i in range(len(tour)):
         length += dist[tour[i-1]][tour[i % len(tour)]]
     return length
 
 
-"""
-2辺を入れ替える関数
-（頂点i-1とiを結んだ辺と頂点j-1とjを結んだ辺を入れ替える）
-引数　tour：配列,　i,j:int型, dist:二次元配列
-"""
-def reverse_segment(tour, i, j, dist):
-    # 交換した方が短くなるなら交換する
-    A, B, C, D = tour[i-1], tour[i], tour[j-1], tour[j % len(tour)]
-
-    #辺AB＋辺CD＞辺AC＋辺BD（入れ替えた方）ならば入れ替える
-    if dist[A][B] + dist[C][D] > dist[A][C] + dist[B][D]:
-        tour[i:j] = reversed(tour[i:j])
-
-
-"""
-経路内にある全ての２辺の組み合わせについて、入れ替えて経路が短くなるなら入れ替える
-引数　tour：配列, dist:二次元配列
-返り値　tour:配列
-"""
-def opt_2(tour,dist):
-
-    #今の経路の経路長
-    original_length=tour_length(tour,dist)
-    #頂点の個数
-    N=len(tour)
-
-    #全ての２辺について入れ替えたら短くなるなら入れ替える処理をする
-    for length in range(N, 1, -1):
-        for start in range(N - length + 1):
-            reverse_segment(tour,start,start + length,dist)
-
-    #入れ替えたの後経路長の方が短くなるなら、再帰的に繰り返す
-    #これはtour_length(tour,dist)=original_lengthとなったら終了する
-    if tour_length(tour,dist)<original_length:
-        return opt_2(tour,dist)
-    
-    #もしもう入れ替えても短くならないなら終了
-    return tour
-
-
-"""
-頂点から未到達の中で最も近い頂点を結ぶような経路を返す関数
-引数　dist:二次元配列
-返り値　tour:配列
-"""
-def greedy(dist):
-    current_city = 0
-    unvisited_cities = set(range(1,len(dist)))
-    tour = [current_city]
-
-    #未到達の頂点がある限りループさせる
-    while unvisited_cities:
-        next_city = min(unvisited_cities,
-                        key=lambda city: dist[current_city][city])
-        unvisited_cities.remove(next_city)
-        tour.append(next_city)
-        current_city = next_city
-    return tour
-
-
-
 """
 メインの関数　cities内の要素をすべて通る時の経路をできるだけ最適化して返す
-引数　cities:配列
+time_limit秒たったら、局所探索の途中でもそこまでで一番短い経路を返す
+checkpointを渡すと、各段階で見つかった経路をcheckpointに報告する（途中で止められても結果が残る）
+statsを渡すと、段階ごとの時間・移動の回数・経路長の変化をstatsに記録する
+引数　cities:配列, neighbor_k:int型（2-optで調べる各都市の近傍の数）,
+　　　method:str型（最初の経路の作り方。construction.CONSTRUCTORSのキー）,
+　　　time_limit:float型（秒、省略可）, checkpoint:Checkpoint（省略可）, stats:SolveStats（省略可）
 返り値　tour:配列
 """
-def solve(cities):
+def solve(cities,neighbor_k=10,method='nearest_neighbor',time_limit=None,checkpoint=None,stats=None):
     N = len(cities)
+    deadline = None if time_limit is None else time.time() + time_limit
+    if stats is None:
+        stats = SolveStats()
 
-    dist = [[0] * N for i in range(N)]
-    for i in range(N):
-        for j in range(i, N):
-            dist[i][j] = dist[j][i] = distance(cities[i], cities[j])
+    #各段階で見つかった経路を記録して、checkpointにも報告する
+    def report(tour,length,label):
+        stats.record(length,label)
+        if checkpoint is not None:
+            checkpoint.update(tour,length)
 
-    #1.経路を求める手法
-    #頂点から未到達の中で最も近い頂点を結ぶような経路を求める
-    tour=greedy(dist)
+    with stats.phase('distance'):
+        dist = distance_table(cities)
 
-    #2.経路をより短いものに改善する手法
-    #2-optでランダムに2本の辺を選び入れ替えて短くなるなら入れ替える
-    opt_2(tour,dist)
+        #各都市から近いneighbor_k個の都市（2-optなどはこの都市との辺だけを候補にする）
+        neighbors=neighbor_lists(cities,neighbor_k)
+
+    #1.経路を求める手法
+    #最近傍法（頂点から未到達の中で最も近い頂点を結ぶ）、貪欲辺法、ヒルベルト曲線、最小全域木から選ぶ
+    with stats.phase('construction'):
+        tour=construct(cities,method,neighbors)
+        length=tour_length(tour,dist)
+    report(tour,length,method)
+
+    with stats.phase('improvement'):
+        #2.経路をより短いものに改善する手法
+        #2-optで2本の辺を入れ替えて短くなるなら入れ替える
+        search_stats=SearchStats()
+        tour,length=two_opt_neighbors(tour,dist,neighbors,search_stats,length,deadline)
+        stats.add_search(search_stats,'2-opt')
+        report(tour,length,'2-opt')
+
+        #3.2-optで直らない、離れたところに取り残された都市や短い区間をOr-optで移す
+        search_stats=SearchStats()
+        tour,length=or_opt(tour,dist,neighbors,search_stats,length,deadline)
+        stats.add_search(search_stats,'or-opt')
+        report(tour,length,'or-opt')
+
+        #4.2-optを何段もつなげたLin-Kernighan法風の移動でさらに改善する
+        search_stats=SearchStats()
+        tour,length=lin_kernighan(tour,dist,neighbors,search_stats,length,deadline)
+        stats.add_search(search_stats,'lin-kernighan')
+        report(tour,length,'lin-kernighan')
 
     return tour
 
 
 if __name__ == '__main__':
+    #--stats ファイル名 を付けると、段階ごとの時間や経路長の変化をJSON（.csvならtraceだけCSV）で書き出す
+    stats_path = pop_option(sys.argv, '--stats')
+    #--profile[=ファイル名]でcProfileの結果を、--trace-memory[=ファイル名]で段階ごとのメモリの使い方を書き出す
+    profiler = Profiler.from_argv(sys.argv)
     assert len(sys.argv) > 1
 
+    #コマンドライン引数２には最初の経路の作り方を入れる（省略したら最近傍法）
+    method = sys.argv[2] if len(sys.argv) > 2 else 'nearest_neighbor'
+    #コマンドライン引数３には制限時間（秒）を入れる（省略したら最後まで探索する）
+    time_limit = float(sys.argv[3]) if len(sys.argv) > 3 else None
+
     start = time.time()
-    tour = solve(read_input('input_{}.csv'.format(sys.argv[1])))
-    with open(f'output_{sys.argv[1]}.csv', 'w') as f:
-                f.write(format_tour(tour) + '\n')
+    stats = SolveStats(profiler)
+    with profiler:
+        with stats.phase('load'):
+            cities = read_input('input_{}.csv'.format(sys.argv[1]))
+        #見つかった経路はoutput_{n}.csvに途中でも書き出し、Ctrl+Cなどで止めてもそれまでの最短の経路が残る
+        with Checkpoint(f'output_{sys.argv[1]}.csv') as checkpoint:
+            tour = solve(cities,method=method,time_limit=time_limit,checkpoint=checkpoint,stats=stats)
+    #from common import print_tour
     #print_tour(tour)
     end = time.time()
-    print('whole time', end-start)
\ No newline at end of file
+    print(stats)
+    if stats_path is not None:
+        stats.dump(stats_path)
+    print('whole time', end-start)
@@ -4,17 +4,22 @@ import sys
 import math
 import random
 import time
-import numpy as np
+import heapq
 
-#追加
-import os
-import concurrent.futures
+from common import read_input,DistanceOracle
+from multistart import multistart, keep_going, STAGE_CONSTRUCTED, STAGE_TWO_OPT, STAGE_FINAL
+from spatial import GridIndex, neighbor_lists
+from construction import nearest_neighbor
+from local_search import two_opt_neighbors, lin_kernighan, SearchStats
+from checkpoint import Checkpoint
+from instrumentation import SolveStats, Profiler, pop_option
 
-from common import print_tour, read_input,format_tour
-
-
-def distance(city1, city2):
-    return math.sqrt((city1[0] - city2[0]) ** 2 + (city1[1] - city2[1]) ** 2)
+#貪欲法で何手先まで見るか（1なら先を見ない最近傍法。ビームサーチ（2以上）で作った経路は
+#Challenge 5で最近傍法より1割以上長く（28959 vs 25332）、2-opt・Lin-Kernighan法のあとも短くならなかったので、
+#ビームサーチは指定したときだけ使う）
+BEAM_DEPTH = 1
+#ビームサーチで各頂点から調べる経路の数（ビーム幅。BEAM_DEPTHが1なら使わない）
+BEAM_WIDTH = 4
 
 
 """
@@ -23,156 +28,78 @@ tour内の頂点を結んだ全長を返す関数
 返り値　length:int型
 """
 def tour_length(tour, dist):
+    #距離行列の代わりにDistanceOracleが渡されたら座標からまとめて計算する
+    if isinstance(dist, DistanceOracle):
+        return dist.tour_length(tour)
+
     # 経路長を計算
     length = 0
-    for i in range(len(tour)+1):
+    for i in range(len(tour)):
         length += dist[tour[i-1]][tour[i % len(tour)]]
     return length
 
 
 """
-2辺を入れ替える関数
-（頂点i-1とiを結んだ辺と頂点j-1とjを結んだ辺を入れ替える）
-引数　tour：配列,　i,j:int型, dist:二次元配列
-"""
-def reverse_segment(tour, i, j, dist):
-    # 交換した方が短くなるなら交換する
-    A, B, C, D = tour[i-1], tour[i], tour[j-1], tour[j % len(tour)]
+ビームサーチで何手か先まで見ながら経路を作る関数
 
-    #辺AB＋辺CD＞辺AC＋辺BD（入れ替えた方）ならば入れ替える
-    if dist[A][B] + dist[C][D] > dist[A][C] + dist[B][D]:
-        tour[i:j] = reversed(tour[i:j])
+今の頂点から、未到達の中で近いwidth個の頂点につなぐ道を候補にして、
+各候補の先でも近いwidth個の頂点につなぐ…をdepth手先まで繰り返す。各段では道の長さが短い
+width個の候補だけを残し（ビーム幅）、最後に最も短い候補の最初の1手だけを採用する。
+→つまり、頂点から最も近い頂点を見るだけでなく、depth手先まで見たときに
+短い経路となるようなルートを取ったほうがよいのでは？という考え
 
+近い未到達の頂点は近傍リストから探し（近傍がみな到達済みなら空間インデックスで探す）、
+候補の道の頂点は一時的に到達済みにして、調べ終わったら戻すので、
+候補ごとに未到達の頂点の集合や経路をコピーしない
 
-"""
-経路内にある全ての２辺の組み合わせについて、入れ替えて経路が短くなるなら入れ替える
-引数　tour：配列, dist:二次元配列
+引数　cities:配列,start_i:int型,width:int型（ビーム幅）,depth:int型（何手先まで見るか）,
+　　　neighbors:二次元配列（各都市の近傍リスト、省略したら作る）
 返り値　tour:配列
 """
-def opt_2(tour,dist):
-
-    #今の経路の経路長
-    original_length=tour_length(tour,dist)
-
-    N=len(tour)
-
-    #全ての２辺について入れ替えたら短くなるなら入れ替える処理をする
-    for length in range(N, 1, -1):
-        for start in range(N - length + 1):
-            reverse_segment(tour,start,start + length,dist)
-
-    #入れ替えたの後経路長の方が短くなるなら、再帰的に繰り返す
-    #これはtour_length(tour,dist)=original_lengthとなったら終了する
-    if tour_length(tour,dist)<original_length:
-        return opt_2(tour,dist)
-    
-    #もしもう入れ替えても短くならないなら終了
-    return tour
-
-
-"""
-各頂点から未到達の中で近い頂点をgreedy_num個とってきて、
-それぞれとつないで６手先までを貪欲法で探すとき最も短い経路を返す関数
-
-→つまり、頂点から最も近い頂点を見るだけでなく、６手先まで貪欲にすすんだときに
-最短経路となるようなルートを取ったほうがよいのでは？という考え。ただし、
-すべての頂点にそれをやるのは非効率的なのでgreedy_num個を取ってきて調べてる
-
-引数　dist:二次元配列,start_i:int型,greedy_num:int型
-返り値　tour:配列
-"""
-def greedy(dist,start_i,greedy_num):
-    current_city = start_i
-    unvisited_cities = set(range(1,len(dist)))
-    tour = [current_city]
-
-    #ここは何手先まで見るかを決める
-    dipth=6
+def greedy(cities,start_i,width,depth=BEAM_DEPTH,neighbors=None):
+    index = GridIndex(cities)
+    N = len(index)
+    x, y = index.x, index.y
+    if neighbors is None:
+        neighbors = neighbor_lists(cities)
+
+    def d(a, b):
+        return math.hypot(x[a] - x[b], y[a] - y[b])
+
+    #cityから近い未到達の頂点をwidth個返す
+    def nearest_unvisited(city):
+        near = [c for c in neighbors[city] if not visited[c]][:width]
+        if not near:
+            #近傍がみな到達済みなら、空間インデックス（採用した頂点だけ取り除いてある）で探す
+            near = [c for c in index.k_nearest(city, width + depth) if not visited[c]][:width]
+        return near
+
+    visited = [False] * N
+    visited[start_i] = True
+    index.remove(start_i)
+    tour = [start_i]
 
     #未到達の頂点がある限りループさせる
-    while unvisited_cities:
-        results=[]
-
-
-        #近い頂点からgreedy_num個取ってきたいので未到達都市をソートする
-        sorted_unvisited_cities = sorted(unvisited_cities,
-                                    key=lambda city: dist[current_city][city])
-        
-        #もしgreedy_num個も頂点がのこっていないなら普通に近い方からつなげていく
-        if greedy_num > len(sorted_unvisited_cities):
-
-            next_city=min(unvisited_cities,
-                            key=lambda city: dist[current_city][city])
-            unvisited_cities.remove(next_city)
-            tour.append(next_city)
-            current_city = next_city
-
-        else:
-            #greedy_num個の近い頂点についてdipth手先まで探索
-            for target_city in sorted_unvisited_cities[:greedy_num]:
-
-                #各target_cityからdipth手先まで探索する用の変数を宣言
-                temp_distance=0
-                #探索開始の頂点
-                temp_current_city=current_city
-                #次の探索頂点
-                temp_next_city=target_city
-                #仮の未到達頂点の配列
-                temp_unvisited_cities=unvisited_cities.copy()
-                #仮の経路用の配列
-                temp_tour=tour.copy()
-
-                #dipth手先まで行く過程で未到達頂点がなくなったとき用
-                #つまりtemp_unvisited_citiesのサイズが０になったとき用
-                flag=0
-
-                for _ in range(dipth):
-
-                    temp_distance+=dist[temp_current_city][temp_next_city]
-
-                    temp_unvisited_cities.remove(temp_next_city)
-                    temp_tour.append(temp_next_city)
-
-                    temp_current_city=temp_next_city
-
-                    #未到達頂点がなくなってなければ次の頂点に行く
-                    if len(temp_unvisited_cities)>0:
-                        temp_next_city=min(temp_unvisited_cities,
-                            key=lambda city: dist[temp_current_city][city])
-                    else:
-                        flag=1
-                        break
-
-                #未到達頂点がなくなったならその経路ではもう最適経路はない
-                if flag:
-                    results.append([None,None,None])
-                else:
-                    results.append([temp_tour,temp_unvisited_cities,temp_distance])
-            
-            #すべてのtarget_cityについて処理が終わった
-            #経路が一番短いものを採用する処理に入る。結果をまとめる
-            results = np.array(results)
-            distances = results[:,2]
-            can_tour = results[:,0]
-            can_unvisited_cities = results[:,1]
-
-            #未到達頂点がなくなったときにNoneが出力される
-            #つまり、 このときはもうdipth分の頂点がないので普通に最も近い頂点をつないでいく
-            if None in distances:
-                while unvisited_cities:
-                    next_city = min(unvisited_cities,
-                                    key=lambda city: dist[current_city][city])
-                    unvisited_cities.remove(next_city)
-                    tour.append(next_city)
-                    current_city = next_city
-
-            #まだまだ未到達頂点がたくさんあるなら、探索を続ける
-            else:
-                mi = np.argmin(distances)
-                tour = can_tour[mi]
-                unvisited_cities = can_unvisited_cities[mi]
-                tour.append(next_city)
-                current_city = next_city
+    while len(tour) < N:
+        #候補は（今の頂点からの道の長さ, 道）
+        beam = [(0.0, ())]
+        for _ in range(min(depth, N - len(tour))):
+            expanded = []
+            for length, path in beam:
+                for city in path:
+                    visited[city] = True
+                last = path[-1] if path else tour[-1]
+                for city in nearest_unvisited(last):
+                    expanded.append((length + d(last, city), path + (city,)))
+                for city in path:
+                    visited[city] = False
+            beam = heapq.nsmallest(width, expanded)
+
+        #最も短い候補の最初の1手だけを採用する
+        next_city = beam[0][1][0]
+        visited[next_city] = True
+        index.remove(next_city)
+        tour.append(next_city)
 
     return tour
 
@@ -180,42 +107,56 @@ def greedy(dist,start_i,greedy_num):
 
 """
 メインの補助関数　start_i地点をスタートとしてcities内の要素をすべて通る時の経路をできるだけ最適化して返す
-引数　cities:配列, start_i:int型,greedy_num:int型
-（返り値はないが一応tours配列に入れたtour配列がこのスタート地点に対する最適経路である）
+（multistart.multistartから各ワーカープロセスで呼ばれる）
+引数　cities:配列, start_i:int型, dist:二次元配列（ワーカーで1回だけ作った距離表）,
+　　　neighbors:二次元配列（各都市の近傍リスト）, greedy_num:int型（ビーム幅）,
+　　　depth:int型（貪欲法で何手先まで見るか、1なら最近傍法）, deadline:float型（time.time()の時刻、省略可）
+返り値　length:float型, tour:配列（このスタート地点に対する最適経路）, 局所探索の回数{名前: SearchStats}、
+　　　　見込みがなくてやめたらNone
 """
-def solve_helper(cities,start_i,tours,greedy_num):
-    print("start : ",start_i)
-
-    N = len(cities)
-
-    dist = [[0] * N for i in range(N)]
-    for i in range(N):
-        for j in range(i, N):
-            dist[i][j] = dist[j][i] = distance(cities[i], cities[j])
-    
-
+def solve_helper(cities,start_i,dist,neighbors,greedy_num=BEAM_WIDTH,depth=BEAM_DEPTH,deadline=None):
     #1.経路を求める手法
-    #頂点から未到達の中で最も近い頂点を結ぶような経路を求める
-    tour=greedy(dist,start_i,greedy_num)
+    #depthが2以上なら、depth手先まで近い頂点をビームサーチで調べて、短くなる方の頂点を結ぶような経路を求める
+    #（1なら最近傍法）
+    if depth>1:
+        tour=greedy(cities,start_i,greedy_num,depth,neighbors)
+    else:
+        tour=nearest_neighbor(cities,start_i)
+
+    #ほかのスタート地点の経路よりずっと長ければ、改善しても見込みがないのでやめる
+    length=tour_length(tour,dist)
+    if not keep_going(STAGE_CONSTRUCTED,length):
+        return None
 
     #2.経路をより短いものに改善する手法
-    #2-optでランダムに2本の辺を選び入れ替えて短くなるなら入れ替える
-    opt_2(tour,dist)
+    #2-optで2本の辺を入れ替えて短くなるなら入れ替える（各都市の近傍との辺だけを候補にする）
+    two_opt_stats=SearchStats()
+    tour,length=two_opt_neighbors(tour,dist,neighbors,two_opt_stats,length,deadline)
+    if not keep_going(STAGE_TWO_OPT,length):
+        return None
 
-    print("finish : ", start_i)
+    #3.2-optを何段もつなげたLin-Kernighan法風の移動とOr-optでさらに改善する
+    lk_stats=SearchStats()
+    tour,length=lin_kernighan(tour,dist,neighbors,lk_stats,length,deadline)
+    keep_going(STAGE_FINAL,length)
 
-    tours.append(tour)
+    return length,tour,{'2-opt':two_opt_stats,'lin-kernighan':lk_stats}
 
 
 
 """
 メインの関数　start_num個のスタート地点をランダムに選んできて探索する
-greedy_numはgreedy_advanced関数にもちいる
+greedy_num（ビーム幅）とdepth（何手先まで見るか）はgreedy関数にもちいる（depthが1なら最近傍法で、greedy_numは使わない）
 （citiesのサイズが大きいときはstart_numを小さくしないと探索がおわらないことに注意）
-引数　cities:配列, start_num:int型,greedy_num:int型
+time_limit秒たつか、経路長がtarget以下になったら、残りのスタート地点は調べずに終える
+checkpointを渡すと、スタート地点の結果が返ってくるたびにcheckpointに報告する
+statsを渡すと、段階ごとの時間・移動の回数・スタート地点ごとの経路長をstatsに記録する
+引数　cities:配列, start_num:int型,greedy_num:int型,depth:int型,
+　　　time_limit:float型（秒、省略可）, target:float型（省略可）, checkpoint:Checkpoint（省略可）,
+　　　stats:SolveStats（省略可）
 返り値　tour:配列
 """
-def solve(cities,start_num,greedy_num):
+def solve(cities,start_num,greedy_num=BEAM_WIDTH,depth=BEAM_DEPTH,time_limit=None,target=None,checkpoint=None,stats=None):
 
     N = len(cities)
 
@@ -226,51 +167,60 @@ def solve(cities,start_num,greedy_num):
         start_list = random.sample(start_list, start_num)
 
 
-    #toursには並列処理で各threadの実行結果である経路tourが入る
-    tours=[]
-    
-    #マルチスレッドで複数のスタート地点からの探索を並列処理する
-    # （モジュールはthreadingよりconcurrent.futuresの方が処理の効率が良いようなので後者を利用）
-    with concurrent.futures.ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
-        #各スタート地点に着いてスレッドを立ち上げる
-        for start_i in start_list:
-            #引数は（各スレッドに対して実行する関数、その関数に対する引数１，引数２、‥）
-            executor.submit(solve_helper,cities, start_i, tours,greedy_num)
-
-
-    #ここまででstart_num個のスタート地点についてsolve_helper関数を実行した
-    #ここから最も経路の短いものを選択すればよい
-
-    ans_tour = None
-    min_length = float('inf')
-    for j in range(len(start_list)):
-        tour = tours[j]
-        try:
-            #経路長を求めている
-            path_l = sum(distance(cities[tour[i]], cities[tour[(i + 1) % N]]) for i in range(N))
-            if path_l < min_length:
-                min_length = path_l
-                ans_tour = tour
-        except:
-            pass
-    
+    if stats is None:
+        stats=SolveStats()
+
+    #2-optで使う近傍リストは全プロセスで共通なので先に1回だけ作る
+    with stats.phase('distance'):
+        neighbors=neighbor_lists(cities)
+
+    #マルチプロセスで複数のスタート地点からの探索を並列処理する
+    #（純粋なPythonの計算はスレッドではGILのせいで並列にならないのでプロセスを使う。
+    #　座標と近傍リストは共有メモリに置き、各プロセスは経路長と経路だけを返す）
+    #制限時間を過ぎたら実行中の局所探索も打ち切る
+    deadline=None if time_limit is None else time.time()+time_limit
+    on_result=None if checkpoint is None else lambda length,tour: checkpoint.update(tour,length)
+    with stats.phase('improvement'):
+        min_length,ans_tour=multistart(cities,start_list,solve_helper,neighbors=neighbors,
+                                     time_limit=time_limit,target=target,on_result=on_result,stats=stats,
+                                     greedy_num=greedy_num,depth=depth,deadline=deadline)
+
     print("path_length : ", min_length)
     return ans_tour
     
 
 if __name__ == '__main__':
-    assert len(sys.argv) > 3
+    #--stats ファイル名 を付けると、段階ごとの時間や経路長の変化をJSON（.csvならtraceだけCSV）で書き出す
+    stats_path = pop_option(sys.argv, '--stats')
+    #--profile[=ファイル名]でcProfileの結果を、--trace-memory[=ファイル名]で段階ごとのメモリの使い方を書き出す
+    profiler = Profiler.from_argv(sys.argv)
+    assert len(sys.argv) > 2
 
     start = time.time()
 
     #コマンドライン引数１には実行するChallengeの番号を、
     #コマンドライン引数２には調べてほしいスタート地点の個数を入れる
-    #コマンドライン引数３には貪欲法で各頂点からいくつの経路を調べてほしいか入れる
-    tour = solve(read_input('input_{}.csv'.format(sys.argv[1])),int(sys.argv[2]),int(sys.argv[3]))
-
-    with open(f'output_{sys.argv[1]}.csv', 'w') as f:
-                f.write(format_tour(tour) + '\n')
-    
+    #コマンドライン引数３には貪欲法で各頂点からいくつの経路を調べてほしいか（ビーム幅）入れる
+    #（ビームサーチをするとき（引数４が2以上）だけ使う。省略したらBEAM_WIDTH）
+    greedy_num = int(sys.argv[3]) if len(sys.argv) > 3 else BEAM_WIDTH
+    #コマンドライン引数４には貪欲法で何手先まで見るかを入れる（省略したらBEAM_DEPTH=1で最近傍法、2以上でビームサーチ）
+    depth = int(sys.argv[4]) if len(sys.argv) > 4 else BEAM_DEPTH
+    #コマンドライン引数５には制限時間（秒）を入れる（省略したら全てのスタート地点を調べる）
+    time_limit = float(sys.argv[5]) if len(sys.argv) > 5 else None
+
+    stats = SolveStats(profiler)
+    with profiler:
+        with stats.phase('load'):
+            cities = read_input('input_{}.csv'.format(sys.argv[1]))
+        #見つかった経路はoutput_{n}.csvに途中でも書き出し、Ctrl+Cなどで止めてもそれまでの最短の経路が残る
+        with Checkpoint(f'output_{sys.argv[1]}.csv') as checkpoint:
+            tour = solve(cities,int(sys.argv[2]),greedy_num,depth,
+                         time_limit=time_limit,checkpoint=checkpoint,stats=stats)
+
+    #from common import print_tour
     #print_tour(tour)
     end = time.time()
+    print(stats)
+    if stats_path is not None:
+        stats.dump(stats_path)
     print('whole time', end-start)
\ No newline at end of file
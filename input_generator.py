@@ -1,16 +1,120 @@
 #!/usr/bin/env python3
 
+import math
 import random
+import argparse
+
+import numpy as np
+
+from common import write_input_cache
 
 CHALLENGE_SIZES = (5, 8, 16, 64, 128, 512, 2048, 8192)
+# Cities per write when an input is written to a CSV file.
+WRITE_CHUNK = 65536
 
 
 def generate_cities(n, max_x=1600.0, max_y=900.0, seed=1):
+    # The generator behind the challenge inputs, kept as it is so that
+    # main() reproduces input_{i}.csv exactly.
     random.seed(seed)
     for i in range(n):
         yield random.uniform(0, max_x), random.uniform(0, max_y)
 
 
+def uniform(rng, n, max_x, max_y):
+    return rng.uniform((0.0, 0.0), (max_x, max_y), size=(n, 2))
+
+
+def clustered(rng, n, max_x, max_y, clusters=None):
+    # Gaussian blobs of different sizes and populations around uniformly
+    # placed centres, about one cluster per 1000 cities by default.
+    if clusters is None:
+        clusters = max(1, min(n, n // 1000 or 1))
+    centres = uniform(rng, clusters, max_x, max_y)
+    sigmas = rng.uniform(0.01, 0.05, size=clusters) * min(max_x, max_y)
+    labels = rng.choice(clusters, size=n, p=rng.dirichlet(np.ones(clusters)))
+    xy = centres[labels] + rng.standard_normal((n, 2)) * sigmas[labels, np.newaxis]
+    return _reflect(xy, max_x, max_y)
+
+
+def grid(rng, n, max_x, max_y, jitter=0.3):
+    # n cells of a grid with the box's aspect ratio, each city moved by up to
+    # jitter cell widths from its cell centre.
+    if n == 0:
+        return np.empty((0, 2))
+    cols = max(1, math.ceil(math.sqrt(n * max_x / max_y)))
+    rows = math.ceil(n / cols)
+    cells = rng.permutation(rows * cols)[:n]
+    cell = np.array((max_x / cols, max_y / rows))
+    centre = (np.column_stack((cells % cols, cells // cols)) + 0.5) * cell
+    xy = centre + rng.uniform(-jitter, jitter, size=(n, 2)) * cell
+    return _reflect(xy, max_x, max_y)
+
+
+def roads(rng, n, max_x, max_y, count=None, bends=3, width=0.002):
+    # Cities strung along count random polylines with bends interior vertices
+    # each, as along roads: every city lands on a segment picked with
+    # probability proportional to its length, then is offset sideways by a
+    # normal with width * the box size as its standard deviation.
+    if count is None:
+        count = max(2, int(math.sqrt(n) / 4))
+    vertices = uniform(rng, count * (bends + 2), max_x, max_y).reshape(count, bends + 2, 2)
+    start = vertices[:, :-1].reshape(-1, 2)
+    vector = vertices[:, 1:].reshape(-1, 2) - start
+    length = np.hypot(vector[:, 0], vector[:, 1])
+    segment = rng.choice(len(length), size=n, p=length / length.sum())
+    t = rng.random(n)[:, np.newaxis]
+    xy = start[segment] + t * vector[segment]
+    xy += rng.standard_normal((n, 2)) * width * max(max_x, max_y)
+    return _reflect(xy, max_x, max_y)
+
+
+def _reflect(xy, max_x, max_y):
+    # Fold points that fell outside the box back in, as if its sides were
+    # mirrors. Clipping would pile every such point onto the boundary and
+    # leave walls of cities along the edges that no real map has.
+    for axis, size in enumerate((max_x, max_y)):
+        if size > 0:
+            folded = np.mod(xy[:, axis], 2 * size)
+            xy[:, axis] = size - np.abs(size - folded)
+        else:
+            xy[:, axis] = 0.0
+    return xy
+
+
+DISTRIBUTIONS = {
+    'uniform': uniform,
+    'clustered': clustered,
+    'grid': grid,
+    'roads': roads,
+}
+
+
+def generate(n, distribution='uniform', max_x=1600.0, max_y=900.0, seed=1, **options):
+    # n cities as an n x 2 float64 array drawn from one of DISTRIBUTIONS.
+    # The same arguments always give the same cities.
+    try:
+        make = DISTRIBUTIONS[distribution]
+    except KeyError:
+        raise ValueError(f'unknown distribution: {distribution!r} '
+                         f'(choose from {", ".join(DISTRIBUTIONS)})') from None
+    return make(np.random.default_rng(seed), n, max_x, max_y, **options)
+
+
+def write_input(filename, xy, cache=True):
+    # Write the cities as an input CSV, WRITE_CHUNK rows per write, in the
+    # same shortest round-trip float format as the challenge inputs. With
+    # cache, also save the .npy sidecar read_input_array would build, so the
+    # first solver run does not have to parse the CSV.
+    xy = np.asarray(xy, dtype=np.float64).reshape(-1, 2)
+    with open(filename, 'w') as f:
+        f.write('x,y\n')
+        for start in range(0, len(xy), WRITE_CHUNK):
+            f.writelines(f'{x},{y}\n' for x, y in xy[start:start + WRITE_CHUNK].tolist())
+    if cache:
+        write_input_cache(filename, xy)
+
+
 def main():
     for i, n in enumerate(CHALLENGE_SIZES):
         with open(f'input_{i}.csv', 'w') as f:
@@ -20,4 +124,20 @@ def main():
 
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(
+        description='Generate input files. Without N, regenerate the challenge inputs.')
+    parser.add_argument('n', nargs='?', type=int, help='number of cities')
+    parser.add_argument('output', nargs='?', help='output CSV (default: input_<distribution>_<n>.csv)')
+    parser.add_argument('--distribution', choices=DISTRIBUTIONS, default='uniform')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--max-x', type=float, default=1600.0)
+    parser.add_argument('--max-y', type=float, default=900.0)
+    parser.add_argument('--no-cache', action='store_true', help='do not write the .npy sidecar')
+    args = parser.parse_intermixed_args()
+
+    if args.n is None:
+        main()
+    else:
+        xy = generate(args.n, args.distribution, args.max_x, args.max_y, args.seed)
+        write_input(args.output or f'input_{args.distribution}_{args.n}.csv', xy,
+                    cache=not args.no_cache)
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import csv
+import json
+import time
+import cProfile
+import itertools
+import contextlib
+import tracemalloc
+
+from local_search import SearchStats
+
+#--trace-memoryで段階ごとに表示する、メモリを多く確保した行の数
+TOP_ALLOCATIONS = 10
+
+
+"""
+solveの中で何にどれだけ時間がかかり、経路がどう短くなったかを記録するクラス
+
+phasesは段階（load, distance, construction, improvementなど）ごとの時間（秒）、
+countersは移動を調べた回数（evaluated）・適用した回数（applied）・適用しなかった回数（rejected）などの回数、
+traceは経路長が分かるたびに記録する（経過時間（秒）, 経路長, 段階）の配列
+solveに渡すと中で記録するので、プロファイラを使わずに問題の大きさごとの時間配分を調べられる
+profilerを渡すと、段階が終わるたびにprofilerにメモリの使い方を記録させる
+引数　profiler:Profiler（省略可）
+"""
+class SolveStats:
+
+    def __init__(self, profiler=None):
+        self.profiler = profiler
+        self.start = time.perf_counter()
+        self.phases = {}
+        self.counters = {}
+        self.trace = []
+        self._current = None
+
+    """
+    with文の中の時間を段階nameの時間に加える関数（同じ段階に何回入っても足していく）
+    引数　name:str型
+    """
+    @contextlib.contextmanager
+    def phase(self, name):
+        previous, self._current = self._current, name
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self._current = previous
+            self.add_time(name, time.perf_counter() - start)
+
+    """
+    段階nameの時間にseconds秒を加える関数（自分で時間を測ったとき用）
+    段階nameが終わったことにして、profilerがあればメモリの使い方を記録させる
+    引数　name:str型, seconds:float型
+    """
+    def add_time(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+        if self.profiler is not None:
+            self.profiler.phase_done(name)
+
+    """
+    回数nameにnを加える関数
+    引数　name:str型, n:int型
+    """
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    """
+    局所探索の回数（SearchStats）をprefix.evaluatedなどとして加え、全体の合計にも加える関数
+    引数　search_stats:SearchStats, prefix:str型
+    """
+    def add_search(self, search_stats, prefix):
+        for name in SearchStats.__slots__:
+            self.count(f'{prefix}.{name}', getattr(search_stats, name))
+        self.count('evaluated', search_stats.evaluations)
+        self.count('applied', search_stats.applied)
+        self.count('rejected', search_stats.evaluations - search_stats.applied)
+
+    """
+    今の経路長lengthを経過時間と一緒にtraceに記録する関数
+    引数　length:float型, label:str型（省略したら今の段階の名前）
+    """
+    def record(self, length, label=None):
+        self.trace.append((time.perf_counter() - self.start, length, label or self._current))
+
+    @property
+    def best_length(self):
+        return min((length for _, length, _ in self.trace), default=None)
+
+    def to_dict(self):
+        return {
+            'elapsed': time.perf_counter() - self.start,
+            'best_length': self.best_length,
+            'phases': dict(self.phases),
+            'counters': dict(self.counters),
+            'trace': [{'time': t, 'length': length, 'phase': label} for t, length, label in self.trace],
+        }
+
+    """
+    記録をファイルpathに書き出す関数
+    .csvならtraceを1行に1つ（time,length,phase）、それ以外は全部をJSONで書き出す
+    引数　path:str型
+    """
+    def dump(self, path):
+        with open(path, 'w', newline='') as f:
+            if path.endswith('.csv'):
+                writer = csv.writer(f)
+                writer.writerow(('time', 'length', 'phase'))
+                writer.writerows(self.trace)
+            else:
+                json.dump(self.to_dict(), f, indent=2)
+                f.write('\n')
+
+    def __repr__(self):
+        lines = ['phases: ' + ', '.join(f'{name}={seconds:.3f}s' for name, seconds in self.phases.items())]
+        totals = [name for name in self.counters if '.' not in name]
+        if totals:
+            lines.append('counters: ' + ', '.join(f'{name}={self.counters[name]}' for name in totals))
+        if self.trace:
+            lines.append(f'best length: {self.best_length} ({len(self.trace)} trace points)')
+        return '\n'.join(lines)
+
+
+"""
+コマンドライン引数argvから「name 値」（またはname=値）を取り除いて値を返す関数
+（位置で指定する引数の番号がずれないように、solverのスクリプトは先にオプションを取り除く）
+nameのあとに値がない（最後の引数か、次が別のオプション）ときはメッセージを出して終了する
+引数　argv:配列（書き換える）, name:str型（例：'--stats'）, default:省略したときの値
+返り値　str型またはdefault
+"""
+def pop_option(argv, name, default=None):
+    for i, arg in enumerate(argv):
+        if arg == name:
+            if i + 1 == len(argv) or argv[i + 1].startswith('--'):
+                sys.exit(f'{name} needs a value ({name} VALUE or {name}=VALUE)')
+            value = argv[i + 1]
+            del argv[i:i + 2]
+            return value
+        if arg.startswith(name + '='):
+            del argv[i]
+            return arg[len(name) + 1:]
+    return default
+
+
+"""
+コマンドライン引数argvから「name」または「name=値」を取り除いて返す関数
+nameだけならdefault、name=値なら値、どちらもなければNoneを返す
+（次の引数は値とみなさない。位置で指定する引数と見分けがつかないので、値は必ず=でつなぐ）
+引数　argv:配列（書き換える）, name:str型, default:str型
+返り値　str型またはNone
+"""
+def pop_switch(argv, name, default):
+    for i, arg in enumerate(argv):
+        if arg == name:
+            del argv[i]
+            return default
+        if arg.startswith(name + '='):
+            del argv[i]
+            return arg[len(name) + 1:]
+    return None
+
+
+"""
+solverのスクリプト全体をcProfileで測り、tracemallocで段階ごとのメモリの使い方を記録するクラス
+
+with文の中をprofile_pathが指定されていればcProfileで測ってpstatsの形式で書き出し、
+memory_pathが指定されていればtracemallocで追いかけて、段階ごと（SolveStatsのphaseが終わるたび）に
+その段階の最大使用量と、その段階で確保されて残っているメモリが多い行の上位top個を書き出す
+（使用量は段階の始めからの増加分。どちらも指定されていなければ何もしない。マルチプロセスのワーカーの中は測らない）
+引数　profile_path:str型（省略可）, memory_path:str型（省略可）, top:int型
+"""
+class Profiler:
+
+    def __init__(self, profile_path=None, memory_path=None, top=TOP_ALLOCATIONS):
+        self.profile_path = profile_path
+        self.memory_path = memory_path
+        self.top = top
+        self._profile = None
+        self._tracing = False
+        self._report = []
+
+    """
+    コマンドライン引数argvから --profile[=ファイル名] と --trace-memory[=ファイル名] を取り除いて
+    Profilerを作る関数（ファイル名を省略したらスクリプトの名前.pstats、スクリプトの名前.memory.txt）
+    引数　argv:配列（書き換える）
+    返り値　Profiler
+    """
+    @classmethod
+    def from_argv(cls, argv):
+        script = os.path.splitext(os.path.basename(argv[0]))[0] if argv else 'solver'
+        return cls(pop_switch(argv, '--profile', f'{script}.pstats'),
+                   pop_switch(argv, '--trace-memory', f'{script}.memory.txt'))
+
+    def __enter__(self):
+        if self.memory_path is not None:
+            tracemalloc.start()
+            self._tracing = True
+        if self.profile_path is not None:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._profile is not None:
+            self._profile.disable()
+            self._profile.dump_stats(self.profile_path)
+            self._profile = None
+            print(f'wrote profile to {self.profile_path}', file=sys.stderr)
+        if self._tracing:
+            self.phase_done('rest')
+            tracemalloc.stop()
+            self._tracing = False
+            with open(self.memory_path, 'w') as f:
+                f.write('\n'.join(self._report) + '\n')
+            print(f'wrote memory report to {self.memory_path}', file=sys.stderr)
+        return False
+
+    """
+    段階nameが終わったときに、その段階の最大使用量と、その段階で確保されて残っているメモリが多い行を記録する関数
+    段階ごとにtracemallocを止めてから集計し、次の段階の始めにまた動かす
+    （動かしたまま集計すると、集計で作るオブジェクトもすべて追いかけるので、都市数が多いと何十秒もかかる）
+    そのため使用量は前の段階から残っているメモリを含まない、その段階で増えた分になる
+    引数　name:str型
+    """
+    def phase_done(self, name):
+        if not self._tracing:
+            return
+        #集計する処理はプロファイルに入れない
+        if self._profile is not None:
+            self._profile.disable()
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        self._report.append(f'== {name}: kept {current / 2**20:.1f} MiB, peak {peak / 2**20:.1f} MiB')
+        #tracemallocとこのファイルの行は報告する上位top個からだけ除く（スナップショット全体は絞らない）
+        ignored = (tracemalloc.__file__, __file__)
+        stats = (stat for stat in snapshot.statistics('lineno')
+                 if stat.traceback[0].filename not in ignored)
+        for stat in itertools.islice(stats, self.top):
+            self._report.append(f'  {stat}')
+        del snapshot, stats
+        tracemalloc.start()
+        if self._profile is not None:
+            self._profile.enable()
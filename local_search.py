@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+
+import time
+from collections import deque
+
+from common import distance_function
+from tour import ArrayTour
+
+#これより小さい改善は浮動小数点の誤差とみなして採用しない
+EPS = 1e-9
+
+#Or-optで動かす区間の最大の長さ
+OR_OPT_MAX = 3
+
+#Lin-Kernighan法で2-opt移動を何段までつなげるか（2段で3-opt、3段で4-opt相当の移動になる）
+#最後の段は反転せずに調べられるので、5段にしても改善はわずかで時間は3倍ほどかかる
+LK_MAX_DEPTH = 3
+#Lin-Kernighan法の各段で試すt3の候補数（これより深い段は1つだけ試す）
+LK_BREADTH = (5, 3)
+
+#締め切りを指定したとき、キューから何都市取り出すごとに時刻を見るか
+DEADLINE_CHECK_INTERVAL = 64
+
+
+"""
+局所探索の途中経過を数えるカウンタ
+
+evaluations：移動（2-optなど）の経路長の変化を計算した回数
+applied：実際に適用した改善移動の数
+checked：キューから取り出して調べた都市の数
+skipped：毎回全都市を調べる方法と比べて、don't-look bitのおかげで調べずに済んだ都市の数
+rounds：キューを一周した回数（全都市を調べる方法の1パスに相当する）
+"""
+class SearchStats:
+    __slots__ = ('evaluations', 'applied', 'checked', 'skipped', 'rounds')
+
+    def __init__(self):
+        self.evaluations = 0
+        self.applied = 0
+        self.checked = 0
+        self.skipped = 0
+        self.rounds = 0
+
+    def __repr__(self):
+        return ('SearchStats(' + ', '.join(f'{name}={getattr(self, name)}'
+                                           for name in self.__slots__) + ')')
+
+
+"""
+都市aを端点とする改善2-opt移動を近傍リストから探して、見つかったら適用する関数
+
+aの近傍リストに入っている都市cとの辺(a,c)を作る移動だけを調べる（近傍リストにa自身が入っていても飛ばす）
+（近傍リストは近い順なので、d(a,c)が外す辺より長くなった時点で打ち切れる）
+引数　tour：ArrayTour, d:関数, neighbors:二次元配列, a:int型, stats:SearchStats
+返り値　移動を適用したら(経路長の変化, 端点の４都市のタプル)、改善移動がなければNone
+"""
+def two_opt_move(tour, d, neighbors, a, stats):
+    #aの次の都市bとの辺(a,b)を外す場合
+    b = tour.next(a)
+    d_ab = d(a, b)
+    for c in neighbors[a]:
+        d_ac = d(a, c)
+        if d_ac >= d_ab:
+            break
+        e = tour.next(c)
+        if c == a or c == b or e == a:
+            continue
+        #辺(a,b),(c,e)を辺(a,c),(b,e)に入れ替えたときの経路長の変化
+        stats.evaluations += 1
+        delta = d_ac + d(b, e) - d_ab - d(c, e)
+        if delta < -EPS:
+            tour.two_opt_move(a, b, c, e)
+            return delta, (a, b, c, e)
+
+    #aの前の都市bとの辺(b,a)を外す場合
+    b = tour.prev(a)
+    d_ab = d(a, b)
+    for c in neighbors[a]:
+        d_ac = d(a, c)
+        if d_ac >= d_ab:
+            break
+        e = tour.prev(c)
+        if c == a or c == b or e == a:
+            continue
+        #辺(b,a),(e,c)を辺(a,c),(b,e)に入れ替えたときの経路長の変化
+        stats.evaluations += 1
+        delta = d_ac + d(b, e) - d_ab - d(c, e)
+        if delta < -EPS:
+            tour.two_opt_move(b, a, e, c)
+            return delta, (a, b, c, e)
+    return None
+
+
+"""
+都市aを端とする長さ1～OR_OPT_MAXの区間を別の場所に移す改善Or-opt移動を探して、見つかったら適用する関数
+
+区間s1..sL（前後の都市をp,nとする）を抜き出してpとnをつなぎ、
+区間の端の都市の近傍リストに入っている都市cの隣に、向きをそのままか反転して差し込む。
+経路長の変化は付け替える辺の長さだけで計算できる（O(1)）
+引数　tour：ArrayTour, d:関数, neighbors:二次元配列, a:int型, stats:SearchStats
+返り値　移動を適用したら(経路長の変化, 端点の都市のタプル)、改善移動がなければNone
+"""
+def or_opt_move(tour, d, neighbors, a, stats):
+    N = len(tour)
+    for L in range(1, OR_OPT_MAX + 1):
+        if N < L + 4:
+            break
+        #aが先頭の区間と、（L>1なら）aが末尾の区間を調べる
+        starts = (a,) if L == 1 else (a, None)
+        for s1 in starts:
+            if s1 is None:
+                s1 = a
+                for _ in range(L - 1):
+                    s1 = tour.prev(s1)
+            segment = [s1]
+            for _ in range(L - 1):
+                segment.append(tour.next(segment[-1]))
+            sL = segment[-1]
+            p, n = tour.prev(s1), tour.next(sL)
+
+            #区間を抜き出してpとnをつないだときに短くなる長さ
+            removed = d(p, s1) + d(sL, n) - d(p, n)
+            if removed <= EPS:
+                continue
+
+            for e in (s1, sL):
+                for c in neighbors[e]:
+                    d_ec = d(e, c)
+                    if d_ec >= removed:
+                        break
+                    if c in segment:
+                        continue
+                    #cの次の辺(c,next(c))と前の辺(prev(c),c)のどちらかに差し込んでeとcをつなぐ
+                    for x, y in ((c, tour.next(c)), (tour.prev(c), c)):
+                        if x in segment or y in segment:
+                            continue
+                        #forward=Trueならx-s1..sL-y、Falseならx-sL..s1-y
+                        forward = (e == s1) == (x == c)
+                        if forward:
+                            added = d(x, s1) + d(sL, y) - d(x, y)
+                        else:
+                            added = d(x, sL) + d(s1, y) - d(x, y)
+                        stats.evaluations += 1
+                        delta = added - removed
+                        if delta < -EPS:
+                            tour.or_move(s1, sL, x, y, forward)
+                            return delta, (p, n, s1, sL, x, y)
+    return None
+
+
+"""
+Lin-Kernighan法の次の段で閉じる移動を、今の段の移動を適用せずに探す関数（_lk_stepから呼ばれる）
+
+今の段の2-opt移動（辺(t1,t2),(t3,t4)を外して(t2,t3),(t1,t4)をつなぐ）は
+t2からt4までの区間を反転するだけなので、反転後の経路の前後の都市は
+区間の中かどうか（between）で求められる。これを使って、次の段で(t1,t4)と(t5,t6)を外して
+(t4,t5),(t6,t1)をつなぐ3-opt移動の利得を、O(N)かかる反転をせずに計算する
+引数　tour：ArrayTour, d:関数, neighbors:二次元配列, t1,t2,t3,t4:int型, g:float型, stats:SearchStats
+返り値　(改善した長さ, t5, t6)、見つからなければNone
+"""
+def _lk_lookahead(tour, d, neighbors, t1, t2, t3, t4, g, stats):
+    #t1→t2の向きを正の向きとして考える
+    if tour.next(t1) == t2:
+        nxt, prv = tour.next, tour.prev
+        lo, hi = t2, t4
+    else:
+        nxt, prv = tour.prev, tour.next
+        lo, hi = t4, t2
+
+    #反転後の経路でのt5の前の都市（t1→t4が正の向きになる）
+    def new_prev(x):
+        if x == t3:
+            return t2
+        if x == t4:
+            return t1
+        return nxt(x) if tour.between(lo, x, hi) else prv(x)
+
+    #反転後の経路でのt4の隣はt1と、反転前のt4の前の都市（t4=t2ならt3）
+    t4_other = t3 if t4 == t2 else prv(t4)
+    for t5 in neighbors[t4]:
+        g1 = g - d(t4, t5)
+        if g1 <= EPS:
+            break
+        if t5 == t1 or t5 == t4_other:
+            continue
+        t6 = new_prev(t5)
+        if t6 == t1:
+            continue
+        stats.evaluations += 1
+        closed = g1 + d(t5, t6) - d(t6, t1)
+        if closed > EPS:
+            return closed, t5, t6
+    return None
+
+
+"""
+Lin-Kernighan法の1段分の探索をする関数（lk_moveから呼ばれる）
+
+いまの経路の辺(t1,t2)を外し、t2の近傍t3との辺(t2,t3)をつなぎ、t3の隣のt4との辺(t3,t4)を外して
+(t4,t1)で閉じる2-opt移動を考える。閉じた経路が元より短くなるなら適用して終わり、
+そうでなければ次の段で閉じる移動を反転せずに探し（_lk_lookahead）、
+それでもなければ実際に適用して(t1,t4)を次に外す辺としてさらに深く探索する。
+gは今までに外した辺の長さの合計からつないだ辺の長さの合計を引いたもの（閉じる辺は含まない）
+改善が見つからなかった段の移動は元に戻す
+引数　tour：ArrayTour, d:関数, neighbors:二次元配列, t1,t2:int型, g:float型, depth:int型,
+　　　flips:配列（適用した移動を戻すための引数の記録）, stats:SearchStats
+返り値　改善した長さ（見つからなければNone）
+"""
+def _lk_step(tour, d, neighbors, t1, t2, g, depth, flips, stats):
+    succ = tour.next(t1) == t2
+    candidates = []
+    for t3 in neighbors[t2]:
+        g1 = g - d(t2, t3)
+        #利得が正の間だけ続ける（近傍リストは近い順なのでここで打ち切れる）
+        if g1 <= EPS:
+            break
+        if t3 == t1 or t3 == tour.next(t2) or t3 == tour.prev(t2):
+            continue
+        #(t2,t3)をつないだあと1つの巡回路に戻せるのは、t3の（t1→t2と同じ向きで）前の都市
+        t4 = tour.prev(t3) if succ else tour.next(t3)
+        if t4 == t1:
+            continue
+        candidates.append((g1 + d(t3, t4), t3, t4))
+
+    candidates.sort(reverse=True)
+    breadth = LK_BREADTH[depth - 1] if depth <= len(LK_BREADTH) else 1
+    for g2, t3, t4 in candidates[:breadth]:
+        stats.evaluations += 1
+        closed = g2 - d(t4, t1)
+        if closed > EPS:
+            #辺(t1,t2),(t3,t4)を外して(t2,t3),(t1,t4)をつなぐ
+            tour.flip(t2, t1, t3, t4)
+            flips.append((t2, t3, t1, t4))
+            return closed
+        if depth >= LK_MAX_DEPTH:
+            continue
+
+        #次の段で閉じられるかは反転せずに調べる
+        found = _lk_lookahead(tour, d, neighbors, t1, t2, t3, t4, g2, stats)
+        if found is not None:
+            closed, t5, t6 = found
+            tour.flip(t2, t1, t3, t4)
+            tour.flip(t4, t1, t5, t6)
+            flips.append((t2, t3, t1, t4))
+            flips.append((t4, t5, t1, t6))
+            return closed
+        if depth + 1 >= LK_MAX_DEPTH:
+            continue
+
+        #さらに深く探すときだけ実際に反転する
+        tour.flip(t2, t1, t3, t4)
+        flips.append((t2, t3, t1, t4))
+        gain = _lk_step(tour, d, neighbors, t1, t4, g2, depth + 1, flips, stats)
+        if gain is not None:
+            return gain
+        tour.flip(*flips.pop())
+    return None
+
+
+"""
+都市aを起点とするLin-Kernighan法風の可変深さの改善移動を探して、見つかったら適用する関数
+
+aとその隣の都市の辺を外すところから、2-opt移動を最大LK_MAX_DEPTH段つなげた移動を探す
+（2-optやOr-optでは抜けられない局所最適解から抜けられる）
+最初の段はLK_BREADTH[0]個、次の段はLK_BREADTH[1]個の候補を試し、それより深い段は最良の候補だけを試す
+引数　tour：ArrayTour, d:関数, neighbors:二次元配列, a:int型, stats:SearchStats
+返り値　移動を適用したら(経路長の変化, 端点の都市のタプル)、改善移動がなければNone
+"""
+def lk_move(tour, d, neighbors, a, stats):
+    for t2 in (tour.next(a), tour.prev(a)):
+        flips = []
+        gain = _lk_step(tour, d, neighbors, a, t2, d(a, t2), 1, flips, stats)
+        if gain is not None:
+            touched = {a, t2}
+            for flip in flips:
+                touched.update(flip)
+            return -gain, tuple(touched)
+    return None
+
+
+"""
+don't-look bitsを使った局所探索
+
+「調べる必要がある都市」のキューを持ち、キューから取り出した都市を端点とする改善移動を
+movesの順に探す。改善移動が見つからなかった都市はキューに戻さない（don't-look bitを立てる）。
+移動を適用したら、辺が変わった端点の都市だけをキューに戻すので、
+2パス目以降は直前に変化があった場所の周りだけを調べることになる。
+キューが空になったら、どの都市からも改善移動がない局所最適解になっている。
+
+movesの各要素は two_opt_move と同じ引数をとり、適用した移動の
+(経路長の変化, 端点の都市のタプル)か、改善移動がなければNoneを返す関数
+経路長は適用した移動の変化量を足して更新するので、最初の1回以外は計算しない
+探索はArrayTourの上で行い、終わったらtourを（回転・向きが変わっている場合もある）結果で上書きする
+deadline（time.time()の時刻）を過ぎたら、局所最適解になる前でもそこまでの経路を返す
+引数　tour：配列, dist:二次元配列またはDistanceOracle, neighbors:二次元配列,
+　　　moves:関数のタプル, stats:SearchStats（省略可）,
+　　　length:float型（tourの経路長。省略したら最初に1回だけ計算する）, deadline:float型（省略可）
+返り値　tour:配列, length:float型（改善後の経路長）
+"""
+def local_search(tour, dist, neighbors, moves, stats=None, length=None, deadline=None):
+    N = len(tour)
+    if stats is None:
+        stats = SearchStats()
+    d = distance_function(dist)
+    if length is None:
+        length = sum(d(tour[i - 1], tour[i]) for i in range(N))
+    if N < 4:
+        return tour, length
+
+    array_tour = ArrayTour(tour)
+
+    #最初は全都市を経路順にキューに入れる。queued[city]がFalseならdon't-look bitが立っている
+    queue = deque(tour)
+    queued = [True] * N
+    #remainingは今のラウンド（全都市を調べる方法の1パス）で残っている都市の数
+    remaining = len(queue)
+
+    while queue:
+        if remaining == 0:
+            #1ラウンド終わったので、次のラウンドで調べない都市の数を数える
+            stats.rounds += 1
+            remaining = len(queue)
+            stats.skipped += N - remaining
+
+        if deadline is not None and stats.checked % DEADLINE_CHECK_INTERVAL == 0 \
+                and time.time() >= deadline:
+            break
+
+        a = queue.popleft()
+        remaining -= 1
+        queued[a] = False
+        stats.checked += 1
+
+        for move in moves:
+            result = move(array_tour, d, neighbors, a, stats)
+            if result is not None:
+                delta, touched = result
+                length += delta
+                stats.applied += 1
+                #辺が変わった都市のdon't-look bitを外してもう一度調べる
+                for city in touched:
+                    if not queued[city]:
+                        queued[city] = True
+                        queue.append(city)
+                break
+
+    stats.rounds += 1
+    tour[:] = array_tour.order
+    return tour, length
+
+
+"""
+近傍リストを使った2-opt
+
+全ての２辺の組を調べる2-optは1回の走査にO(N^2)かかるが、
+各都市の近傍K個との辺だけを調べるのでO(N*K)で済む。さらにdon't-look bitsで
+直前に変化があった都市の周りだけを調べ直す
+引数　tour：配列, dist:二次元配列またはDistanceOracle, neighbors:二次元配列,
+　　　stats:SearchStats（省略可）, length:float型（tourの経路長、省略可）,
+　　　deadline:float型（time.time()の時刻、省略可）
+返り値　tour:配列, length:float型
+"""
+def two_opt_neighbors(tour, dist, neighbors, stats=None, length=None, deadline=None):
+    return local_search(tour, dist, neighbors, (two_opt_move,), stats, length, deadline)
+
+
+"""
+近傍リストを使った2-optとOr-opt
+
+2-optの局所最適解でも、離れたところに取り残された都市や短い区間は
+2-optではなかなか直らないので、区間を移すOr-opt移動も合わせて使う
+（2-optで改善した後に使うと、少ない評価回数でより良い局所最適解になる）
+引数　tour：配列, dist:二次元配列またはDistanceOracle, neighbors:二次元配列,
+　　　stats:SearchStats（省略可）, length:float型（tourの経路長、省略可）,
+　　　deadline:float型（time.time()の時刻、省略可）
+返り値　tour:配列, length:float型
+"""
+def or_opt(tour, dist, neighbors, stats=None, length=None, deadline=None):
+    return local_search(tour, dist, neighbors, (two_opt_move, or_opt_move), stats, length, deadline)
+
+
+"""
+近傍リストを使ったLin-Kernighan法風の局所探索
+
+2-optを何段もつなげた可変深さの移動（lk_move）とOr-opt移動をdon't-look bitsで回す
+2-optだけでは大きいChallengeで局所最適解にはまってしまうのを改善する
+引数　tour：配列, dist:二次元配列またはDistanceOracle, neighbors:二次元配列,
+　　　stats:SearchStats（省略可）, length:float型（tourの経路長、省略可）,
+　　　deadline:float型（time.time()の時刻、省略可）
+返り値　tour:配列, length:float型
+"""
+def lin_kernighan(tour, dist, neighbors, stats=None, length=None, deadline=None):
+    return local_search(tour, dist, neighbors, (lk_move, or_opt_move), stats, length, deadline)
@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+
+import math
+import time
+import random
+import argparse
+import functools
+
+import numpy as np
+
+from common import distance_matrix, DistanceOracle
+from construction import nearest_neighbor, greedy_edge
+from spatial import neighbor_lists
+from tour import ArrayTour
+from local_search import SearchStats, two_opt_neighbors
+import greedy_opt2
+import output_verifier
+
+#測る都市数
+DEFAULT_SIZES = (128, 512, 2048, 8192)
+#distanceカーネルで1回に計算する都市の組の数
+DISTANCE_PAIRS = 100000
+#reverse_segmentカーネルで1回に反転する区間の数
+REVERSALS = 2000
+
+
+def distance(city1, city2):
+    return math.sqrt((city1[0] - city2[0]) ** 2 + (city1[1] - city2[1]) ** 2)
+
+
+"""
+各solverが元々使っていた距離行列の作り方（二重ループでdistance()を呼ぶ）
+比較用に残している
+引数　cities:配列
+返り値　dist:二次元配列
+"""
+def distance_matrix_loop(cities):
+    N = len(cities)
+    dist = [[0] * N for i in range(N)]
+    for i in range(N):
+        for j in range(i, N):
+            dist[i][j] = dist[j][i] = distance(cities[i], cities[j])
+    return dist
+
+
+"""
+各solverが元々使っていた貪欲法（距離行列の行を毎回全部見て最も近い未到達の都市を選ぶ、O(N^2)）
+比較用に残している
+引数　dist:二次元配列
+返り値　tour:配列
+"""
+def greedy_matrix(dist):
+    N = len(dist)
+    current_city = 0
+    unvisited = set(range(1, N))
+    tour = [current_city]
+    while unvisited:
+        row = dist[current_city]
+        current_city = min(unvisited, key=lambda city: row[city])
+        unvisited.remove(current_city)
+        tour.append(current_city)
+    return tour
+
+
+"""
+各solverが元々使っていた2-optの入れ替え（頂点i-1とiを結んだ辺と頂点j-1とjを結んだ辺を、
+入れ替えた方が短くなるなら入れ替える）。比較用に残している
+引数　tour:配列, i,j:int型, dist:二次元配列
+返り値　入れ替えで短くなった経路長（入れ替えなかったら0）
+"""
+def reverse_segment(tour, i, j, dist):
+    A, B, C, D = tour[i-1], tour[i], tour[j-1], tour[j % len(tour)]
+    old_len, new_len = dist[A][B] + dist[C][D], dist[A][C] + dist[B][D]
+    if old_len > new_len:
+        tour[i:j] = reversed(tour[i:j])
+        return old_len - new_len
+    return 0
+
+
+"""
+各solverが元々使っていた2-opt（全ての２辺の組についてreverse_segmentを呼ぶ）の走査1回分
+比較用に残している
+引数　tour:配列, dist:二次元配列
+返り値　調べた２辺の組の数
+"""
+def opt_2_pass(tour, dist):
+    N = len(tour)
+    evaluations = 0
+    tour.reverse()
+    for segment in range(N - 1, 1, -1):
+        for start in range(N - segment + 1):
+            reverse_segment(tour, start, start + segment, dist)
+        evaluations += N - segment + 1
+    return evaluations
+
+
+"""
+ベンチマークに使うデータ（都市数Nのランダムな都市と、それから作るもの）
+距離行列などは使う実装があるときだけ作って、同じNのほかの実装と使い回す
+引数　N:int型, seed:int型
+"""
+class Instance:
+
+    def __init__(self, N, seed):
+        self.N = N
+        rng = np.random.default_rng(seed)
+        self.xy = rng.uniform((0.0, 0.0), (1600.0, 900.0), size=(N, 2))
+        self.cities = list(zip(self.xy[:, 0].tolist(), self.xy[:, 1].tolist()))
+        self.rng = random.Random(seed)
+        self.tour = list(range(N))
+        self.rng.shuffle(self.tour)
+
+    @functools.cached_property
+    def matrix(self):
+        return distance_matrix(self.cities).tolist()
+
+    @functools.cached_property
+    def oracle(self):
+        return DistanceOracle(self.cities)
+
+    @functools.cached_property
+    def neighbors(self):
+        return neighbor_lists(self.cities)
+
+    @functools.cached_property
+    def nn_tour(self):
+        return nearest_neighbor(self.cities)
+
+    @functools.cached_property
+    def pairs(self):
+        return [(self.rng.randrange(self.N), self.rng.randrange(self.N)) for _ in range(DISTANCE_PAIRS)]
+
+    @functools.cached_property
+    def segments(self):
+        return [tuple(sorted(self.rng.sample(range(self.N), 2))) for _ in range(REVERSALS)]
+
+
+def _distance_pairs(inst, d):
+    def run():
+        for i, j in inst.pairs:
+            d(i, j)
+        return len(inst.pairs)
+    return run
+
+
+def _distance_cities(inst, d):
+    cities = inst.cities
+    return _distance_pairs(inst, lambda i, j: d(cities[i], cities[j]))
+
+
+def _matrix_lookup(inst):
+    dist = inst.matrix
+    return _distance_pairs(inst, lambda i, j: dist[i][j])
+
+
+def _fixed_ops(func, ops):
+    def run():
+        func()
+        return ops
+    return run
+
+
+def _tour_length_loop(inst):
+    dist, tour, N = inst.matrix, inst.tour, inst.N
+    return _fixed_ops(lambda: greedy_opt2.tour_length(tour, dist), N)
+
+
+def _tour_length_dist(inst):
+    cities, tour, N = inst.cities, inst.tour, inst.N
+    return _fixed_ops(lambda: sum(math.dist(cities[tour[i - 1]], cities[tour[i]]) for i in range(N)), N)
+
+
+def _tour_length_numpy(inst):
+    xy, tour = inst.xy, np.asarray(inst.tour)
+    return _fixed_ops(lambda: output_verifier.tour_length(xy, tour), inst.N)
+
+
+def _reverse_slice(inst):
+    tour = inst.tour[:]
+    def run():
+        for i, j in inst.segments:
+            tour[i:j] = reversed(tour[i:j])
+        return len(inst.segments)
+    return run
+
+
+#reverse_segmentは短くなるときだけ反転するので、反転ではなく2-opt移動の評価1回（短くなれば反転も含む）として測る
+def _reverse_segment(inst):
+    tour, dist = inst.tour[:], inst.matrix
+    def run():
+        for i, j in inst.segments:
+            reverse_segment(tour, i, j, dist)
+        return len(inst.segments)
+    return run
+
+
+def _reverse_array_tour(inst):
+    tour = ArrayTour(inst.tour)
+    def run():
+        for i, j in inst.segments:
+            tour.reverse(i, j - 1)
+        return len(inst.segments)
+    return run
+
+
+def _two_opt_move(inst):
+    tour = ArrayTour(inst.tour)
+    def run():
+        order = tour.order
+        for i, j in inst.segments:
+            a, c = order[i - 1], order[j - 1]
+            b, d = tour.next(a), tour.next(c)
+            if b != c and d != a:
+                tour.two_opt_move(a, b, c, d)
+        return len(inst.segments)
+    return run
+
+
+def _opt_2_pass(inst):
+    dist = inst.matrix
+    return lambda: opt_2_pass(inst.nn_tour[:], dist)
+
+
+def _two_opt_neighbors(inst):
+    dist = inst.matrix if inst.N <= 4096 else inst.oracle
+    def run():
+        stats = SearchStats()
+        two_opt_neighbors(inst.nn_tour[:], dist, inst.neighbors, stats)
+        return stats.evaluations
+    return run
+
+
+#カーネル→(1回の操作の説明, [(実装の名前, 測る最大の都市数, 測る関数を作る関数)])
+#測る関数を作る関数はInstanceを受け取り、実行すると行った操作の回数を返す関数を返す
+#（元の実装は大きなNでは時間や数GBのメモリがかかるので最大の都市数で絞る）
+KERNELS = {
+    'distance': ('1 pair', [
+        ('distance()', None, lambda inst: _distance_cities(inst, distance)),
+        ('math.hypot', None, lambda inst: _distance_cities(
+            inst, lambda a, b: math.hypot(a[0] - b[0], a[1] - b[1]))),
+        ('math.dist', None, lambda inst: _distance_cities(inst, math.dist)),
+        ('DistanceOracle', None, lambda inst: _distance_pairs(inst, inst.oracle)),
+        ('matrix lookup', 4096, _matrix_lookup),
+    ]),
+    'matrix': ('1 entry', [
+        ('loop', 2048, lambda inst: _fixed_ops(lambda: distance_matrix_loop(inst.cities), inst.N ** 2)),
+        ('np64', None, lambda inst: _fixed_ops(lambda: distance_matrix(inst.cities), inst.N ** 2)),
+        ('np64+list', 4096, lambda inst: _fixed_ops(
+            lambda: distance_matrix(inst.cities).tolist(), inst.N ** 2)),
+        ('np32', None, lambda inst: _fixed_ops(
+            lambda: distance_matrix(inst.cities, dtype=np.float32), inst.N ** 2)),
+    ]),
+    'tour_length': ('1 edge', [
+        ('loop (matrix)', 4096, _tour_length_loop),
+        ('math.dist', None, _tour_length_dist),
+        ('numpy', None, _tour_length_numpy),
+    ]),
+    'reverse_segment': ('1 reversal', [
+        ('list slice', None, _reverse_slice),
+        ('ArrayTour.reverse', None, _reverse_array_tour),
+        ('ArrayTour 2-opt', None, _two_opt_move),
+    ]),
+    'greedy': ('1 step', [
+        ('matrix scan', 4096, lambda inst: _fixed_ops(lambda: greedy_matrix(inst.matrix), inst.N)),
+        ('nearest_neighbor', None, lambda inst: _fixed_ops(lambda: nearest_neighbor(inst.cities), inst.N)),
+        ('greedy_edge', None, lambda inst: _fixed_ops(lambda: greedy_edge(inst.cities), inst.N)),
+    ]),
+    'opt_2': ('1 evaluation', [
+        ('reverse_segment', 4096, _reverse_segment),
+        ('full pass', 2048, _opt_2_pass),
+        ('neighbor lists', None, _two_opt_neighbors),
+    ]),
+}
+
+
+"""
+funcをrepeat回実行して一番速かった実行時間と、そのときの操作の回数を返す関数
+引数　func:関数（実行すると操作の回数を返す）, repeat:int型
+返り値　best:float型（秒）, ops:int型
+"""
+def best_time(func, repeat):
+    best, best_ops = float('inf'), 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        ops = func()
+        elapsed = time.perf_counter() - start
+        if elapsed < best:
+            best, best_ops = elapsed, ops
+    return best, best_ops
+
+
+"""
+log(ns/op)をlog(N)に直線で当てはめた傾き（ns/opがN^eで増えるときのe）を返す関数
+（全体の時間は操作の回数の分だけさらに増える。2点未満なら計算できないのでNone）
+引数　sizes:配列, ns:配列
+返り値　float型またはNone
+"""
+def scaling_exponent(sizes, ns):
+    if len(sizes) < 2:
+        return None
+    return float(np.polyfit(np.log(sizes), np.log(ns), 1)[0])
+
+
+"""
+カーネルkernelの各実装を都市数sizesで測って、1回の操作あたりの時間（ns）と
+都市数に対する増え方（scaling_exponent）を並べて表示する関数
+引数　kernel:str型, sizes:配列, repeat:int型, seed:int型
+返り値　results:辞書（実装の名前→{N: ns/op}）
+"""
+def bench_kernel(kernel, sizes, repeat, seed):
+    unit, variants = KERNELS[kernel]
+    print(f'{kernel} (ns per {unit})')
+    print(f'{"":>18}' + ''.join(f'{N:>12}' for N in sizes) + f'{"exponent":>10}')
+    results = {name: {} for name, _, _ in variants}
+    for N in sizes:
+        inst = Instance(N, seed)
+        for name, max_n, make in variants:
+            if max_n is not None and N > max_n:
+                continue
+            elapsed, ops = best_time(make(inst), repeat)
+            results[name][N] = elapsed / max(ops, 1) * 1e9
+    for name, _, _ in variants:
+        ns = results[name]
+        cells = ''.join(f'{ns[N]:>12.1f}' if N in ns else f'{"-":>12}' for N in sizes)
+        exponent = scaling_exponent(list(ns), list(ns.values()))
+        print(f'{name:>18}{cells}' + (f'{exponent:>10.2f}' if exponent is not None else f'{"-":>10}'))
+    print()
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Micro-benchmarks for the hot kernels.')
+    parser.add_argument('kernels', nargs='*', help=f'kernels to run (default: all of {", ".join(KERNELS)})')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='numbers of cities')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per measurement (the best is kept)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    kernels = args.kernels or list(KERNELS)
+    unknown = [kernel for kernel in kernels if kernel not in KERNELS]
+    if unknown:
+        parser.error(f'unknown kernel: {", ".join(unknown)}')
+    for kernel in kernels:
+        bench_kernel(kernel, args.sizes, args.repeat, args.seed)
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+
+import os
+import time
+import math
+import multiprocessing
+import concurrent.futures
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from common import MATRIX_LIMIT, distance_matrix, DistanceOracle
+from spatial import neighbor_lists
+
+
+#探索の段階（段階ごとに全ワーカーで最も短い経路長を共有する）
+STAGE_CONSTRUCTED = 0
+STAGE_TWO_OPT = 1
+STAGE_FINAL = 2
+#その段階の最短の経路長よりこの割合以上長い経路は、この先改善しても見込みがないとして打ち切る
+#（最後の段階では打ち切らない）
+ABANDON_SLACK = (0.10, 0.05, math.inf)
+
+#ワーカープロセスごとに1回だけ作って、すべてのスタート地点で使い回すデータ
+_worker = {}
+
+
+"""
+NumPy配列を共有メモリにコピーする関数
+引数　array:NumPy配列
+返り値　shm:SharedMemory（使い終わったらclose()とunlink()する）
+"""
+def _to_shared(array):
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+    return shm
+
+
+"""
+ワーカープロセスの初期化関数
+共有メモリの座標と近傍リストを読み、距離表を用意する
+dist_nameがあれば共有メモリの距離行列（float64）の各行をmemoryviewにして、コピーせずにdist[i][j]で引けるようにする
+（ワーカーごとにN×Nのリストを作らない）。dist_nameがNoneならDistanceOracleで座標から計算する
+"""
+def _init_worker(xy_name, nb_name, dist_name, N, k, best, stop):
+    xy_shm = shared_memory.SharedMemory(name=xy_name)
+    nb_shm = shared_memory.SharedMemory(name=nb_name)
+    xy = np.ndarray((N, 2), dtype=np.float64, buffer=xy_shm.buf)
+    nb = np.ndarray((N, k), dtype=np.int32, buffer=nb_shm.buf)
+    cities = xy.tolist()
+    shms = [xy_shm, nb_shm]
+    if dist_name is None:
+        dist = DistanceOracle(cities)
+    else:
+        dist_shm = shared_memory.SharedMemory(name=dist_name)
+        shms.append(dist_shm)
+        flat = dist_shm.buf.cast('d')
+        dist = [flat[i * N:(i + 1) * N] for i in range(N)]
+    _worker.update(
+        #共有メモリはプロセスが終わるまで開いておく
+        shm=shms,
+        cities=cities,
+        neighbors=nb.tolist(),
+        dist=dist,
+        best=best,
+        stop=stop,
+    )
+
+
+"""
+ワーカーで探索の段階stageが終わったときに経路長lengthを報告し、このスタート地点の探索を続けるかを返す関数
+lengthが全ワーカーでのその段階の最短の経路長より短ければ更新する。
+コーディネーターが止めるように言っているときや、最短の経路長より ABANDON_SLACK 以上長いときはFalseを返す
+（multistartの外から呼ばれたときは常にTrue）
+引数　stage:int型, length:float型
+返り値　bool型
+"""
+def keep_going(stage, length):
+    best = _worker.get('best')
+    if best is None:
+        return True
+    if _worker['stop'].value:
+        return False
+    with best.get_lock():
+        incumbent = best[stage]
+        if length < incumbent:
+            best[stage] = length
+    return length <= incumbent * (1 + ABANDON_SLACK[stage])
+
+
+"""
+ワーカープロセスで1つのスタート地点について helper を実行する関数
+返り値　(length, tour)
+"""
+def _run_start(helper, start_i, options):
+    return helper(_worker['cities'], start_i, _worker['dist'], _worker['neighbors'], **options)
+
+
+"""
+複数のスタート地点からの探索をプロセスプールで並列に行い、最も短い経路を返す関数
+
+スレッドでは純粋なPythonの計算がGILで1つずつしか進まないので、プロセスで並列にする。
+座標と近傍リスト、MATRIX_LIMIT都市以下なら距離行列も親プロセスで1回だけ作って共有メモリに置き、
+各ワーカーはそれをコピーせずに使う（大きい問題ではDistanceOracleで計算する）。ワーカーからは(length, tour)だけを返す。
+helperはモジュールの関数（pickleできるもの）で、
+helper(cities, start_i, dist, neighbors, **options) -> (length, tour) の形にする
+（(length, tour, {名前: SearchStats}) を返すと、局所探索の回数をstatsに加える）。
+helperは各段階のあとでkeep_goingを呼び、Falseならそのスタート地点をあきらめてNoneを返す
+time_limit秒たつか、経路長がtarget以下の経路が見つかったら、まだ始まっていないスタート地点を取り消し、
+実行中のワーカーにも止まるように伝えて、それまでの最短の経路を返す（1つも終わっていなければ最初の1つを待つ）
+startsが空ならValueErrorを出す
+引数　cities:配列, starts:配列（スタート地点）, helper:関数, workers:int型（省略したらCPU数）,
+　　　neighbors:二次元配列（省略したら作る）, time_limit:float型（秒、省略可）,
+　　　target:float型（目標の経路長、省略可）,
+　　　on_result:関数（スタート地点の結果(length, tour)が返ってくるたびに呼ぶ、省略可）,
+　　　stats:SolveStats（スタート地点の数・終わった数・あきらめた数・取り消した数と、
+　　　　　　結果の経路長が返ってきた時刻を記録する、省略可）,
+　　　options:helperに渡す追加の引数
+返り値　length:float型, tour:配列
+"""
+def multistart(cities, starts, helper, workers=None, neighbors=None,
+               time_limit=None, target=None, on_result=None, stats=None, **options):
+    if len(starts) == 0:
+        raise ValueError('multistart needs at least one start city')
+    start = time.perf_counter()
+    xy = np.asarray(cities, dtype=np.float64).reshape(-1, 2)
+    N = len(xy)
+    if neighbors is None:
+        neighbors = neighbor_lists(cities)
+    nb = np.asarray(neighbors, dtype=np.int32).reshape(N, -1)
+    workers = min(workers or os.cpu_count() or 1, len(starts))
+
+    #全ワーカーで共有する各段階の最短の経路長と、止まるように伝えるフラグ
+    best = multiprocessing.Array('d', [math.inf] * len(ABANDON_SLACK))
+    stop = multiprocessing.Value('b', False)
+
+    shms = [_to_shared(xy), _to_shared(nb)]
+    dist_name = None
+    if N <= MATRIX_LIMIT:
+        #距離行列は共有メモリに直接書き込む（作ってからコピーするとN×Nの行列が一時的に2つになる）
+        dist_shm = shared_memory.SharedMemory(create=True, size=max(N * N * 8, 1))
+        shms.append(dist_shm)
+        distance_matrix(xy, out=np.ndarray((N, N), dtype=np.float64, buffer=dist_shm.buf))
+        dist_name = dist_shm.name
+    results = []
+    try:
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=workers, initializer=_init_worker,
+                initargs=(shms[0].name, shms[1].name, dist_name, N, nb.shape[1], best, stop)) as executor:
+            pending = {executor.submit(_run_start, helper, start_i, options) for start_i in starts}
+            if stats is not None:
+                stats.count('starts', len(starts))
+            try:
+                while pending:
+                    timeout = None
+                    if time_limit is not None and results:
+                        timeout = max(0.0, time_limit - (time.perf_counter() - start))
+                    done, pending = concurrent.futures.wait(
+                        pending, timeout, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in done:
+                        result = future.result()
+                        if stats is not None:
+                            stats.count('abandoned' if result is None else 'finished')
+                        if result is not None:
+                            #helperが3つ目に局所探索の回数{名前: SearchStats}を返したらstatsに加える
+                            if len(result) > 2:
+                                if stats is not None:
+                                    for prefix, search_stats in result[2].items():
+                                        stats.add_search(search_stats, prefix)
+                                result = result[:2]
+                            results.append(result)
+                            if stats is not None:
+                                stats.record(result[0])
+                            if on_result is not None:
+                                on_result(*result)
+                    if not results:
+                        continue
+                    out_of_time = time_limit is not None and time.perf_counter() - start >= time_limit
+                    reached = target is not None and min(r[0] for r in results) <= target
+                    if out_of_time or reached:
+                        break
+            finally:
+                #途中で終える（時間切れ・目標達成・例外やシグナル）ときは、まだ始まっていない
+                #スタート地点を取り消し、実行中のワーカーには次の段階の区切りで止まってもらう
+                stop.value = True
+                cancelled = sum(future.cancel() for future in pending)
+                if stats is not None:
+                    stats.count('cancelled', cancelled)
+    finally:
+        for shm in shms:
+            shm.close()
+            shm.unlink()
+
+    return min(results, key=lambda result: result[0])
@@ -1,33 +1,128 @@
 #!/usr/bin/env python3
 
-import math
+import os
+import re
+import sys
+import json
+import argparse
+import concurrent.futures
 
-from common import read_input
+import numpy as np
 
-CHALLENGES = 7
+from common import load_tour, read_input_array
 
+OUTPUT_PREFIXES = ('output', 'sample/random', 'sample/greedy', 'sample/sa')
+# The prefix whose files must exist and be valid; the others are references
+# that are skipped when absent and never affect the exit status.
+CHECKED_PREFIX = 'output'
 
-def distance(city1, city2):
-    return math.sqrt((city1[0] - city2[0]) ** 2 + (city1[1] - city2[1]) ** 2)
 
+def discover_challenges(directory='.'):
+    # Challenge numbers of the input_{n}.csv files present, in order.
+    numbers = []
+    for name in os.listdir(directory):
+        match = re.fullmatch(r'input_(\d+)\.csv', name)
+        if match:
+            numbers.append(int(match.group(1)))
+    return sorted(numbers)
 
-def verify_output():
-    for challenge_number in range(CHALLENGES):
-        print(f'Challenge {challenge_number}')
-        cities = read_input(f'input_{challenge_number}.csv')
-        N = len(cities)
-        for output_prefix in ('output', 'sample/random', 'sample/greedy', 'sample/sa'):
-            output_file = f'{output_prefix}_{challenge_number}.csv'
-            with open(output_file) as f:
-                lines = f.readlines()
-                assert lines[0].strip() == 'index'
-                tour = [int(i.strip()) for i in lines[1:N + 1]]
-            assert set(tour) == set(range(N))
-            path_length = sum(distance(cities[tour[i]], cities[tour[(i + 1) % N]])
-                              for i in range(N))
-            print(f'{output_prefix:16}: {path_length:>10.2f}')
-        print()
+
+def tour_length(xy, tour):
+    # Length of the closed tour over the N x 2 coordinate array xy.
+    path = xy[tour]
+    d = path - np.roll(path, -1, axis=0)
+    return float(np.sqrt(d[:, 0] * d[:, 0] + d[:, 1] * d[:, 1]).sum())
+
+
+def permutation_error(tour, N):
+    # None if tour visits each of 0..N-1 exactly once, otherwise why not.
+    if len(tour) != N:
+        return f'{len(tour)} cities, expected {N}'
+    if N and (tour.min() < 0 or tour.max() >= N):
+        return f'city index out of range 0..{N - 1}'
+    counts = np.bincount(tour, minlength=N)
+    if (counts != 1).any():
+        missing = int((counts == 0).sum())
+        return f'{missing} cities missing, {int((counts > 1).sum())} visited twice'
+    return None
+
+
+def verify_file(challenge_number, output_prefix, directory='.'):
+    # Check one output file and return its entry for the report.
+    output_file = f'{output_prefix}_{challenge_number}.csv'
+    result = {'challenge': challenge_number, 'prefix': output_prefix,
+              'file': output_file, 'valid': False, 'skipped': False, 'length': None, 'error': None}
+    path = os.path.join(directory, output_file)
+    if output_prefix != CHECKED_PREFIX and not os.path.exists(path):
+        result['skipped'] = True
+        return result
+    xy = read_input_array(os.path.join(directory, f'input_{challenge_number}.csv'))
+    N = len(xy)
+    try:
+        tour = load_tour(path, max_rows=N)
+    except (OSError, ValueError) as e:
+        result['error'] = str(e)
+        return result
+    result['error'] = permutation_error(tour, N)
+    if result['error'] is None:
+        result['valid'] = True
+        result['length'] = tour_length(xy, tour)
+    return result
+
+
+def verify_output(directory='.', challenges=None, prefixes=OUTPUT_PREFIXES, workers=None):
+    # Verify every challenge/prefix combination in a process pool and
+    # return the report entries in challenge, then prefix order.
+    if challenges is None:
+        challenges = discover_challenges(directory)
+    jobs = [(n, prefix) for n in challenges for prefix in prefixes]
+    if not jobs:
+        return []
+    workers = min(workers or os.cpu_count() or 1, len(jobs))
+    # Parse each input once up front so the workers all map the .npy cache.
+    for n in challenges:
+        read_input_array(os.path.join(directory, f'input_{n}.csv'))
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(verify_file, n, prefix, directory) for n, prefix in jobs]
+        return [future.result() for future in futures]
+
+
+def print_report(report):
+    challenge_number = None
+    for result in report:
+        if result['challenge'] != challenge_number:
+            if challenge_number is not None:
+                print()
+            challenge_number = result['challenge']
+            print(f'Challenge {challenge_number}')
+        if result['valid']:
+            print(f'{result["prefix"]:16}: {result["length"]:>10.2f}')
+        elif result['skipped']:
+            print(f'{result["prefix"]:16}: skipped (no file)')
+        else:
+            print(f'{result["prefix"]:16}: INVALID ({result["error"]})')
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Verify the tours in the output files.')
+    parser.add_argument('challenges', nargs='*', type=int,
+                        help='challenge numbers (default: every input_*.csv present)')
+    parser.add_argument('--json', metavar='PATH', help='write the report as JSON to PATH')
+    parser.add_argument('--workers', type=int, help='worker processes (default: CPU count)')
+    args = parser.parse_args()
+
+    report = verify_output(challenges=args.challenges or None, workers=args.workers)
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+            f.write('\n')
+    # A non-zero exit status lets batch scripts stop on a bad output. Only
+    # the output_* files count; the sample references are informational.
+    return 0 if all(result['valid'] for result in report
+                    if result['prefix'] == CHECKED_PREFIX) else 1
 
 
 if __name__ == '__main__':
-    verify_output()
+    sys.exit(main())
@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 
-from common import format_tour, read_input
+from common import dump_tour, read_input
 
 import solver_greedy
 import solver_random
@@ -14,7 +14,7 @@ def generate_sample_output():
         for solver, name in ((solver_random, 'random'), (solver_greedy, 'greedy')):
             tour = solver.solve(cities)
             with open(f'sample/{name}_{i}.csv', 'w') as f:
-                f.write(format_tour(tour) + '\n')
+                dump_tour(tour, f)
 
 
 if __name__ == '__main__':
@@ -4,6 +4,8 @@ import sys
 import math
 
 from common import print_tour, read_input
+from instrumentation import SolveStats, Profiler
+from construction import nearest_neighbor
 
 
 def distance(city1, city2):
@@ -11,27 +13,20 @@ def distance(city1, city2):
 
 
 def solve(cities):
-    N = len(cities)
-
-    dist = [[0] * N for i in range(N)]
-    for i in range(N):
-        for j in range(i, N):
-            dist[i][j] = dist[j][i] = distance(cities[i], cities[j])
-
-    current_city = 0
-    unvisited_cities = set(range(1, N))
-    tour = [current_city]
-
-    while unvisited_cities:
-        next_city = min(unvisited_cities,
-                        key=lambda city: dist[current_city][city])
-        unvisited_cities.remove(next_city)
-        tour.append(next_city)
-        current_city = next_city
-    return tour
+    # Nearest unvisited city via a grid index instead of scanning every
+    # unvisited city from a distance matrix; same tour when there are no ties.
+    return nearest_neighbor(cities)
 
 
 if __name__ == '__main__':
+    # --profile[=PATH] / --trace-memory[=PATH] write a cProfile dump and a
+    # per-phase allocation report; the tour on stdout is unchanged.
+    profiler = Profiler.from_argv(sys.argv)
     assert len(sys.argv) > 1
-    tour = solve(read_input(sys.argv[1]))
+    stats = SolveStats(profiler)
+    with profiler:
+        with stats.phase('load'):
+            cities = read_input(sys.argv[1])
+        with stats.phase('construction'):
+            tour = solve(cities)
     print_tour(tour)
@@ -3,6 +3,7 @@
 import sys
 
 from common import print_tour, read_input
+from instrumentation import SolveStats, Profiler
 
 
 def solve(cities):
@@ -12,6 +13,14 @@ def solve(cities):
 
 
 if __name__ == '__main__':
+    # --profile[=PATH] / --trace-memory[=PATH] write a cProfile dump and a
+    # per-phase allocation report; the tour on stdout is unchanged.
+    profiler = Profiler.from_argv(sys.argv)
     assert len(sys.argv) > 1
-    tour = solve(read_input(sys.argv[1]))
+    stats = SolveStats(profiler)
+    with profiler:
+        with stats.phase('load'):
+            cities = read_input(sys.argv[1])
+        with stats.phase('construction'):
+            tour = solve(cities)
     print_tour(tour)
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+
+import math
+
+import numpy as np
+
+
+"""
+格子状のバケットに都市を振り分けた空間インデックス
+
+各セルに平均bucket_size個の都市が入るように平面を区切り、
+ある点の近くの都市を近いセルから順に調べることで全都市を見ずに近傍を探す
+引数　cities:配列, bucket_size:int型
+"""
+class GridIndex:
+
+    def __init__(self, cities, bucket_size=2):
+        self.xy = np.asarray(cities, dtype=np.float64).reshape(-1, 2)
+        self.x = self.xy[:, 0].tolist()
+        self.y = self.xy[:, 1].tolist()
+        N = len(self.xy)
+
+        min_x, min_y = self.xy.min(axis=0) if N else (0.0, 0.0)
+        max_x, max_y = self.xy.max(axis=0) if N else (0.0, 0.0)
+        width = max(max_x - min_x, 1e-9)
+        height = max(max_y - min_y, 1e-9)
+
+        #セルがほぼ正方形で、全体でN/bucket_size個くらいになるように分割数を決める
+        #（都市が直線上に並んでいるときなどは、長い方の辺だけをN/bucket_size個に分ける大きさより小さくしない）
+        cell = max(math.sqrt(width * height * bucket_size / max(N, 1)),
+                   max(width, height) * bucket_size / max(N, 1))
+        self.nx = max(1, min(int(width / cell), 1 << 15))
+        self.ny = max(1, min(int(height / cell), 1 << 15))
+        self.min_x = float(min_x)
+        self.min_y = float(min_y)
+        self.cell_w = width / self.nx
+        self.cell_h = height / self.ny
+        #リングr+1のセルにある点はリングrまでのセルの点よりr*cell_min以上離れている
+        #（1列しかない方向にはリングが広がらないので、その方向のセルの大きさは使わない）
+        sizes = [size for size, n in ((self.cell_w, self.nx), (self.cell_h, self.ny)) if n > 1]
+        self.cell_min = min(sizes) if sizes else max(self.cell_w, self.cell_h)
+
+        cx = np.minimum(((self.xy[:, 0] - min_x) / self.cell_w).astype(np.intp), self.nx - 1)
+        cy = np.minimum(((self.xy[:, 1] - min_y) / self.cell_h).astype(np.intp), self.ny - 1)
+        self.cell_x = cx.tolist()
+        self.cell_y = cy.tolist()
+
+        #cells[cy][cx]にそのセルに入っている都市の番号のリストを入れる
+        self.cells = [[[] for _ in range(self.nx)] for _ in range(self.ny)]
+        for city in range(N):
+            self.cells[self.cell_y[city]][self.cell_x[city]].append(city)
+
+    def __len__(self):
+        return len(self.x)
+
+    """
+    セル(cx,cy)を中心とする一辺2r+1の正方形の外周にあるセルの都市を列挙する関数
+    引数　cx,cy,r:int型
+    返り値　都市番号のジェネレータ
+    """
+    def ring(self, cx, cy, r):
+        cells = self.cells
+        x0, x1 = cx - r, cx + r
+        y0, y1 = cy - r, cy + r
+        for y in range(max(y0, 0), min(y1, self.ny - 1) + 1):
+            row = cells[y]
+            if y == y0 or y == y1:
+                #上下の辺は端から端まで
+                for x in range(max(x0, 0), min(x1, self.nx - 1) + 1):
+                    yield from row[x]
+            else:
+                #左右の辺は両端のセルだけ
+                if x0 >= 0:
+                    yield from row[x0]
+                if x1 < self.nx:
+                    yield from row[x1]
+
+    """
+    都市iから近い順にk個の都市を返す関数（都市i自身は含まない）
+    removeで取り除いた都市は返さない（都市i自身が取り除かれていてもよい）
+    引数　i,k:int型
+    返り値　配列
+    """
+    def k_nearest(self, i, k):
+        if k <= 0:
+            return []
+        cx, cy = self.cell_x[i], self.cell_y[i]
+        max_r = max(self.nx, self.ny)
+        candidates = []
+        r = 0
+        while r <= max_r:
+            candidates.extend(city for city in self.ring(cx, cy, r) if city != i)
+            #k個以上見つかったら、まだ見ていないセルの点の方が必ず遠いと言えるまで広げる
+            if len(candidates) >= k:
+                ids = np.fromiter(candidates, dtype=np.intp, count=len(candidates))
+                d = self.xy[ids] - self.xy[i]
+                d *= d
+                d2 = d[:, 0] + d[:, 1]
+                kth = np.partition(d2, k - 1)[k - 1]
+                if kth <= (r * self.cell_min) ** 2:
+                    break
+            r += 1
+        if not candidates:
+            return []
+        ids = np.fromiter(candidates, dtype=np.intp, count=len(candidates))
+        d = self.xy[ids] - self.xy[i]
+        d *= d
+        d2 = d[:, 0] + d[:, 1]
+        order = np.lexsort((ids, d2))
+        return ids[order[:k]].tolist()
+
+    """
+    都市cityをインデックスから取り除く関数（nearestで見つからなくなる）
+    引数　city:int型
+    """
+    def remove(self, city):
+        self.cells[self.cell_y[city]][self.cell_x[city]].remove(city)
+
+    """
+    インデックスに残っている都市の中で都市iに最も近い都市を返す関数
+    （都市i自身は取り除いてあること。距離が同じなら番号の小さい方）
+    近いセルから順に調べ、見つけた都市よりまだ見ていないセルの方が必ず遠いと言えたら止める
+    引数　i:int型
+    返り値　int型（残っている都市がなければ-1）
+    """
+    def nearest(self, i):
+        x, y = self.x, self.y
+        xi, yi = x[i], y[i]
+        cx, cy = self.cell_x[i], self.cell_y[i]
+        max_r = max(self.nx, self.ny)
+        best, best_d2 = -1, math.inf
+        r = 0
+        while r <= max_r:
+            for city in self.ring(cx, cy, r):
+                dx = x[city] - xi
+                dy = y[city] - yi
+                d2 = dx * dx + dy * dy
+                if d2 < best_d2 or (d2 == best_d2 and city < best):
+                    best, best_d2 = city, d2
+            if best_d2 <= (r * self.cell_min) ** 2:
+                break
+            r += 1
+        return best
+
+
+"""
+各都市について近い順にk個の都市を並べた近傍リストを作る関数
+2-optなどの局所探索はこのリストに入っている都市との辺だけを候補にする
+引数　cities:配列, k:int型
+返り値　neighbors:二次元配列（neighbors[i]は都市iの近傍都市を近い順に並べたもの）
+"""
+def neighbor_lists(cities, k=10):
+    index = GridIndex(cities)
+    return [index.k_nearest(i, k) for i in range(len(index))]
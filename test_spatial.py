@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+
+import math
+import random
+
+from spatial import GridIndex, neighbor_lists
+from construction import nearest_neighbor
+
+
+"""
+全都市との距離を調べて、都市iから近い順にk個の都市を返す関数（比較用）
+"""
+def brute_force_k_nearest(cities, i, k):
+    others = [j for j in range(len(cities)) if j != i]
+    return sorted(others, key=lambda j: (math.dist(cities[i], cities[j]), j))[:k]
+
+
+def check_neighbor_lists(cities, k=10):
+    neighbors = neighbor_lists(cities, k)
+    for i in range(len(cities)):
+        assert neighbors[i] == brute_force_k_nearest(cities, i, k)
+
+
+#x座標が全部同じ（幅が0）
+def test_vertical_line():
+    check_neighbor_lists([(5.0, float(i)) for i in range(20)])
+    assert nearest_neighbor([(2, 3), (2, 1), (2, 0)]) == [0, 1, 2]
+
+
+#y座標が全部同じ（高さが0）
+def test_horizontal_line():
+    check_neighbor_lists([(float(i) * 0.5, -3.0) for i in range(50)])
+
+
+#ほとんど直線上に並んでいる
+def test_thin_strip():
+    rng = random.Random(0)
+    check_neighbor_lists([(rng.uniform(0, 1000), rng.uniform(0, 1e-6)) for _ in range(300)])
+
+
+#全部同じ点
+def test_duplicate_points():
+    cities = [(1.0, 1.0)] * 8
+    check_neighbor_lists(cities, k=3)
+    assert nearest_neighbor(cities) == list(range(8))
+
+
+#同じ点を含む直線
+def test_duplicates_on_line():
+    check_neighbor_lists([(0.0, float(i // 3)) for i in range(30)], k=5)
+
+
+def test_nearest_after_remove():
+    cities = [(0.0, float(i)) for i in range(10)]
+    index = GridIndex(cities)
+    for city in (0, 1, 9):
+        index.remove(city)
+    assert index.nearest(0) == 2
+    assert index.nearest(9) == 8
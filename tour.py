@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+
+
+"""
+配列で表した巡回路
+
+order[i]は経路のi番目の都市、pos[city]は都市cityが経路の何番目にあるかを持つので、
+ある都市の前後の都市や位置をO(1)で求められる。
+2-opt移動では反転する区間とその残り（補集合）のどちらを反転しても同じ巡回路になるので、
+短い方だけを反転する（平均の反転コストが半分になる）
+引数　tour:配列（都市番号の順列）
+"""
+class ArrayTour:
+    __slots__ = ('order', 'pos', 'n')
+
+    def __init__(self, tour):
+        self.order = list(tour)
+        self.n = len(self.order)
+        self.pos = [0] * self.n
+        for i, city in enumerate(self.order):
+            self.pos[city] = i
+
+    def __len__(self):
+        return self.n
+
+    def __iter__(self):
+        return iter(self.order)
+
+    def tolist(self):
+        return self.order[:]
+
+    """
+    都市cityの次の都市を返す関数
+    """
+    def next(self, city):
+        i = self.pos[city] + 1
+        return self.order[i if i < self.n else 0]
+
+    """
+    都市cityの前の都市を返す関数
+    """
+    def prev(self, city):
+        return self.order[self.pos[city] - 1]
+
+    """
+    都市aから順方向に進んで都市cに着くまでの間（a,cを含む）に都市bがあるかを返す関数
+    引数　a,b,c:int型
+    返り値　bool型
+    """
+    def between(self, a, b, c):
+        pa, pb, pc = self.pos[a], self.pos[b], self.pos[c]
+        if pa <= pc:
+            return pa <= pb <= pc
+        return pb >= pa or pb <= pc
+
+    """
+    経路のi番目からj番目まで（j<iなら末尾から先頭に回り込む）をその場で反転する関数
+    引数　i,j:int型
+    """
+    def reverse(self, i, j):
+        order, pos, n = self.order, self.pos, self.n
+        for _ in range(((j - i) % n + 1) // 2):
+            a, b = order[i], order[j]
+            order[i], pos[b] = b, i
+            order[j], pos[a] = a, j
+            i += 1
+            if i == n:
+                i = 0
+            j -= 1
+            if j < 0:
+                j = n - 1
+
+    """
+    2-opt移動　辺(a,b),(c,d)を辺(a,c),(b,d)に入れ替える関数
+    （b=next(a), d=next(c)であること）
+    bからcまでを反転するのと、dからaまでを反転するのは同じ巡回路になるので短い方を反転する
+    引数　a,b,c,d:int型
+    """
+    def two_opt_move(self, a, b, c, d):
+        pos, n = self.pos, self.n
+        inner = (pos[c] - pos[b]) % n + 1
+        if inner * 2 <= n:
+            self.reverse(pos[b], pos[c])
+        else:
+            self.reverse(pos[d], pos[a])
+
+    """
+    向きを気にせずに辺(a,b),(c,d)を辺(a,c),(b,d)に入れ替える関数
+    （b=next(a), d=next(c) か b=prev(a), d=prev(c) のどちらかであること）
+    引数　a,b,c,d:int型
+    """
+    def flip(self, a, b, c, d):
+        if self.next(a) == b:
+            self.two_opt_move(a, b, c, d)
+        else:
+            self.two_opt_move(b, a, d, c)
+
+    """
+    Or-opt移動　区間s1..sL（p=prev(s1), n=next(sL)）を抜き出して辺(x,y)の間に入れる関数
+    （y=next(x)で、x,yは区間に含まれないこと）
+    forward=Trueならx-s1..sL-y、Falseならx-sL..s1-yとつなぐ
+    2-opt移動（flip）を2～3回続けて行うことで実現する
+    引数　s1,sL,x,y:int型, forward:bool型
+    """
+    def or_move(self, s1, sL, x, y, forward):
+        p, n = self.prev(s1), self.next(sL)
+        if x == n:
+            #p s1..sL n y → p n sL..s1 y
+            self.flip(p, s1, n, y)
+        elif y == p:
+            #x p s1..sL n → x sL..s1 p n
+            self.flip(x, p, sL, n)
+        else:
+            #p s1..sL n..x y → p x..n sL..s1 y → p n..x sL..s1 y
+            self.flip(p, s1, x, y)
+            self.flip(p, x, n, sL)
+        if forward and s1 != sL:
+            #x sL..s1 y → x s1..sL y
+            self.flip(x, sL, s1, y)
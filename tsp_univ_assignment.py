@@ -7,7 +7,13 @@ import time
 import itertools
 from collections import deque
 
-from common import print_tour, read_input,format_tour
+from common import print_tour, read_input,format_tour,distance_table,DistanceOracle
+from spatial import neighbor_lists
+from construction import nearest_neighbor
+from local_search import two_opt_neighbors, or_opt, lin_kernighan, SearchStats
+from annealing import simulated_annealing, DEFAULT_TIME_LIMIT
+from exact import held_karp, branch_and_bound
+from instrumentation import SolveStats, Profiler, pop_option
 
 
 def distance(city1, city2):
@@ -20,9 +26,13 @@ tour内の頂点を結んだ全長を返す関数
 返り値　length:int型
 """
 def tour_length(tour, dist):
+    #距離行列の代わりにDistanceOracleが渡されたら座標からまとめて計算する
+    if isinstance(dist, DistanceOracle):
+        return dist.tour_length(tour)
+
     # 経路長を計算
     length = 0
-    for i in range(len(tour)+1):
+    for i in range(len(tour)):
         length += dist[tour[i-1]][tour[i % len(tour)]]
     return length
 
@@ -31,14 +41,23 @@ def tour_length(tour, dist):
 2辺を入れ替える関数
 （頂点i-1とiを結んだ辺と頂点j-1とjを結んだ辺を入れ替える）
 引数　tour：配列,　i,j:int型, dist:二次元配列
+返り値　入れ替えで短くなった経路長（入れ替えなかったら0）
 """
 def reverse_segment(tour, i, j, dist):
     # 交換した方が短くなるなら交換する
     A, B, C, D = tour[i-1], tour[i], tour[j-1], tour[j % len(tour)]
 
+    #DistanceOracleなら行を作らずに必要な４辺だけ計算する
+    if isinstance(dist, DistanceOracle):
+        old_len, new_len = dist(A, B) + dist(C, D), dist(A, C) + dist(B, D)
+    else:
+        old_len, new_len = dist[A][B] + dist[C][D], dist[A][C] + dist[B][D]
+
     #辺AB＋辺CD＞辺AC＋辺BD（入れ替えた方）ならば入れ替える
-    if dist[A][B] + dist[C][D] > dist[A][C] + dist[B][D]:
+    if old_len > new_len:
         tour[i:j] = reversed(tour[i:j])
+        return old_len - new_len
+    return 0
 
 
 
@@ -83,97 +102,83 @@ def search_all_path(dist,N):
 http://www.cas.mcmaster.ca/~nedialk/COURSES/4f03/tsp/tsp.pdf
 """
 def recursive_dfs(dist,N):
+    #訪問済みかどうかはbool配列で調べ、途中までの経路長は1辺ずつ足して持つ
+    visited=[False]*N
+    visited[0]=True
+    new_tour=[0]
+    min_tour=[]
+    min_length=1e100
 
-    def recursive_dfs_sub(tour_size,new_tour):
-        global min_tour,min_length
-        new_len=tour_length(new_tour,dist)
+    def recursive_dfs_sub(new_len):
+        nonlocal min_tour,min_length
+        last=new_tour[-1]
 
         #すべての頂点を通ったあと、その経路長が最短経路か調べる
-        if N==tour_size:
-            new_len+=dist[0][new_tour[tour_size-1]]
-            
+        if N==len(new_tour):
+            new_len+=dist[last][0]
+
             if new_len<min_length:
                 #すべての頂点を訪れたときのみmin_lengthを更新できる
                 min_length=new_len
                 min_tour=new_tour[:]
+            return
 
-        else :
-            #すべての子ノードに対して以下の処理
-            for i in range(1,N):
-
-                #i番目の頂点に到達済ならループを抜ける
-                if i in new_tour:
-                    continue
-
-                #まだすべての頂点を訪れていない時点で、すでに経路長がmin_lengthより
-                # 長いならそれ以上深くに行かない。min_lengthより短いなら再帰呼び出しでさらに深くまで行く
-                if new_len<min_length:
-                    new_tour.append(i)
-                    recursive_dfs_sub(tour_size+1,new_tour)
-                    new_tour.pop()
+        #すべての子ノードに対して以下の処理
+        for i in range(1,N):
 
-    global min_tour,min_length
+            #i番目の頂点に到達済ならとばす
+            if visited[i]:
+                continue
 
-    #tourは後で経路を返す配列
-    min_tour=[]
-    min_length=1e100
+            #まだすべての頂点を訪れていない時点で、すでに経路長がmin_lengthより
+            # 長いならそれ以上深くに行かない。min_lengthより短いなら再帰呼び出しでさらに深くまで行く
+            next_len=new_len+dist[last][i]
+            if next_len<min_length:
+                visited[i]=True
+                new_tour.append(i)
+                recursive_dfs_sub(next_len)
+                new_tour.pop()
+                visited[i]=False
 
-    recursive_dfs_sub(1,[0])
+    recursive_dfs_sub(0)
 
     return min_tour,min_length
 
 
 
-"""
-貪欲法
-
-ある頂点から未到達の頂点の中で最も近い頂点をぶのを繰り返し、求めた経路を返す関数
-引数　dist:二次元配列
-返り値：tour：配列
-
-参考　同じリポジトリ内のsolver_greedy.py
-"""
-def greedy(dist):
-    current_city = 0
-    unvisited_cities = set(range(1,len(dist)))
-    tour = [current_city]
-
-    #未到達の頂点がある限りループさせる
-    while unvisited_cities:
-        next_city = min(unvisited_cities,
-                        key=lambda city: dist[current_city][city])
-        unvisited_cities.remove(next_city)
-        tour.append(next_city)
-        current_city = next_city
-    return tour
-
-
 """
 2_opt
 
 経路内にある全ての２辺の組み合わせについて、入れ替えて経路が短くなるなら入れ替える
-引数　tour：配列, dist:二次元配列
-返り値　tour:配列
+1回の走査で経路が短くならなくなるまで走査を繰り返す
+経路長は入れ替えで短くなった分を引いて更新するので、走査のたびに計算し直さない
+引数　tour：配列, dist:二次元配列, length:float型（tourの経路長。省略したら最初に1回だけ計算する）
+返り値　tour:配列, length:float型（改善後の経路長）
 """
-def two_opt(tour,dist):
+def two_opt(tour,dist,length=None):
 
     #今の経路の経路長
-    original_length=tour_length(tour,dist)
+    if length is None:
+        length=tour_length(tour,dist)
     #頂点の個数
     N=len(tour)
 
-    #全ての２辺について入れ替えたら短くなるなら入れ替える処理をする
-    for length in range(N, 1, -1):
-        for start in range(N - length + 1):
-            reverse_segment(tour,start,start + length,dist)
+    #入れ替えで短くなった分がほぼ0になるまで繰り返す
+    #（再帰で繰り返すと改善が遅いときに再帰の上限に達するのでループにする）
+    gain=float('inf')
+    while gain>1e-9:
+        gain=0
+        #全ての２辺について入れ替えたら短くなるなら入れ替える処理をする
+        #segment=Nは経路全体の反転で、経路長は変わらないのに短くなったと計算されてしまうので
+        #reverse_segmentを使わずに反転だけする（走査の順番は今までと同じになる）
+        tour.reverse()
+        for segment in range(N - 1, 1, -1):
+            for start in range(N - segment + 1):
+                gain+=reverse_segment(tour,start,start + segment,dist)
+        length-=gain
 
-    #入れ替えたの後経路長の方が短くなるなら、再帰的に繰り返す
-    #これはtour_length(tour,dist)=original_lengthとなったら終了する
-    if tour_length(tour,dist)<original_length:
-        return two_opt(tour,dist)
-    
     #もしもう入れ替えても短くならないなら終了
-    return tour
+    return tour,length
 
 
 
@@ -182,8 +187,9 @@ def two_opt(tour,dist):
 
 経路内にある全ての２辺の組み合わせについて、入れ替えて経路が短くなるなら入れ替えるが、
 短くならなくても確率的に入れ替える関数
+経路長は入れ替えのたびに変化量を足して更新し、温度ごとに計算し直さない
 引数　tour：配列, dist:二次元配列
-返り値　tour:配列
+返り値　tour:配列（最も短かった経路）, length:float型（その経路長）
 """
 def two_opt_with_SA(tour,dist):
     #温度の減少割合
@@ -199,6 +205,8 @@ def two_opt_with_SA(tour,dist):
     #いままでで最も短い経路を入れる
     best_tour=tour[:]
     best_length=tour_length(tour,dist)
+    #今の経路の経路長（入れ替えるたびに変化量を足して更新する）
+    current_length=best_length
 
     N=len(tour)
 
@@ -212,14 +220,19 @@ def two_opt_with_SA(tour,dist):
         #print("tour=",best_length)
 
         #2-optのアルゴリズム
-        for length in range(N, 1, -1):
+        #length=Nは経路全体の反転で経路長は変わらないので、反転だけする
+        tour.reverse()
+        for length in range(N - 1, 1, -1):
             for start in range(N - length + 1):
                 i=start
                 j=start+length
 
                 A, B, C, D = tour[i-1], tour[i], tour[j-1], tour[j% len(tour)]
                 #diff_len=入れ替え前ー入れ替え後の経路長差
-                diff_len=(dist[A][B] + dist[C][D])-(dist[A][C] + dist[B][D])
+                if isinstance(dist, DistanceOracle):
+                    diff_len=(dist(A, B) + dist(C, D))-(dist(A, C) + dist(B, D))
+                else:
+                    diff_len=(dist[A][B] + dist[C][D])-(dist[A][C] + dist[B][D])
                 
                 #current_tが大きいほど（後になるほど）確率possibは小さくなる、
                 #よくオーバーフローするので値para_for_tを微調整
@@ -228,37 +241,44 @@ def two_opt_with_SA(tour,dist):
                 #辺AB＋辺CD＞辺AC＋辺BD（入れ替えた方）ならば入れ替える
                 if diff_len>0:
                     tour[i:j] = reversed(tour[i:j])
+                    current_length-=diff_len
 
                 #辺AB＋辺CD<=辺AC＋辺BD（入れ替えた方）でも確率的に入れ替える   
                 #入れ替える確率のしきい値はランダムだが、possibの方の値は経路の変化量と現在の温度に依存
                 elif possib>=random.uniform(0,1):
                     tour[i:j] = reversed(tour[i:j])
+                    current_length-=diff_len
 
         #current_tは徐々に小さくする
         current_t*= alpha
-        current_length=tour_length(tour,dist)
 
         if  current_length<best_length:
             best_tour=tour[:]
             best_length=current_length
 
-    return best_tour
+    return best_tour,best_length
 
 
 
 """
 メインの関数　cities内の要素をすべて通る時の経路をできるだけ最適化して返す
-引数　cities:配列
-返り値　tour:配列
+引数　cities:配列, algorithm_num:int型, time_limit:float型（時間を指定できるアルゴリズムの制限時間（秒）。
+　　　省略したら6～8は局所最適解になるまで続け、9と11はDEFAULT_TIME_LIMIT秒で打ち切る）,
+　　　stats:SolveStats（省略可）, seed:int型（焼きなまし法（9）の乱数の種、省略可）
+返り値　tour:配列, search_time:float型, tour_len:float型（厳密解法で解けない大きさのときはtourとtour_lenがNone）
 """
-def solve(cities,algorithm_num):
+def solve(cities,algorithm_num,time_limit=None,stats=None,seed=None):
     N = len(cities)
+    if stats is None:
+        stats = SolveStats()
 
-    dist = [[0] * N for i in range(N)]
-    for i in range(N):
-        for j in range(i, N):
-            dist[i][j] = dist[j][i] = distance(cities[i], cities[j])
+    with stats.phase('distance'):
+        dist = distance_table(cities)
 
+    #6～8の局所探索の締め切り（制限時間がなければ局所最適解になるまで続ける）
+    deadline = None if time_limit is None else time.time()+time_limit
+    #9は制限時間いっぱいまで焼きなまし、11は大きい問題だと終わらないので、制限時間がなければDEFAULT_TIME_LIMIT秒にする
+    limit = DEFAULT_TIME_LIMIT if time_limit is None else time_limit
 
     #コマンドライン引数(algorithm_num)でアルゴリズムを指定する
     if algorithm_num==1:
@@ -293,7 +313,7 @@ def solve(cities,algorithm_num):
         print("貪欲法のみ")
         start = time.time()
 
-        tour=greedy(dist)
+        tour=nearest_neighbor(cities)
 
         end = time.time()
         search_time=end-start
@@ -307,12 +327,11 @@ def solve(cities,algorithm_num):
         print("貪欲法＋2_opt")
         start = time.time()
 
-        tour=greedy(dist)
-        tour=two_opt(tour,dist)
+        tour=nearest_neighbor(cities)
+        tour,tour_len=two_opt(tour,dist)
 
         end = time.time()
         search_time=end-start
-        tour_len=tour_length(tour,dist)
 
         print('whole time: ', search_time)
         print('tour_length: ', tour_len)
@@ -322,19 +341,139 @@ def solve(cities,algorithm_num):
         print("貪欲法＋2_opt+焼きなまし法")
         start = time.time()
 
-        tour=greedy(dist)
-        tour=two_opt_with_SA(tour,dist)
+        tour=nearest_neighbor(cities)
+        tour,tour_len=two_opt_with_SA(tour,dist)
 
         end = time.time()
 
         search_time=end-start
-        tour_len=tour_length(tour,dist)
 
         print('whole time: ', search_time)
         print('tour_length: ', tour_len)
+
+    elif algorithm_num==6:
+        #貪欲法＋近傍リストを使った2_opt
+        print("貪欲法＋近傍リスト2_opt")
+        start = time.time()
+
+        tour=nearest_neighbor(cities)
+        neighbors=neighbor_lists(cities)
+        two_opt_stats=SearchStats()
+        tour,tour_len=two_opt_neighbors(tour,dist,neighbors,two_opt_stats,deadline=deadline)
+
+        end = time.time()
+        search_time=end-start
+
+        print('whole time: ', search_time)
+        print('tour_length: ', tour_len)
+        print('2-opt: ', two_opt_stats)
+        stats.add_search(two_opt_stats,'2-opt')
+
+    elif algorithm_num==7:
+        #貪欲法＋近傍リストを使った2_opt＋Or-opt
+        print("貪欲法＋近傍リスト2_opt＋Or-opt")
+        start = time.time()
+
+        tour=nearest_neighbor(cities)
+        neighbors=neighbor_lists(cities)
+        two_opt_stats=SearchStats()
+        tour,tour_len=two_opt_neighbors(tour,dist,neighbors,two_opt_stats,deadline=deadline)
+        or_stats=SearchStats()
+        tour,tour_len=or_opt(tour,dist,neighbors,or_stats,tour_len,deadline=deadline)
+
+        end = time.time()
+        search_time=end-start
+
+        print('whole time: ', search_time)
+        print('tour_length: ', tour_len)
+        print('2-opt: ', two_opt_stats)
+        stats.add_search(two_opt_stats,'2-opt')
+        print('Or-opt: ', or_stats)
+        stats.add_search(or_stats,'or-opt')
+
+    elif algorithm_num==8:
+        #貪欲法＋近傍リスト2_opt＋Lin-Kernighan法風の可変深さ探索
+        print("貪欲法＋近傍リスト2_opt＋Lin-Kernighan")
+        start = time.time()
+
+        tour=nearest_neighbor(cities)
+        neighbors=neighbor_lists(cities)
+        two_opt_stats=SearchStats()
+        tour,tour_len=two_opt_neighbors(tour,dist,neighbors,two_opt_stats,deadline=deadline)
+        lk_stats=SearchStats()
+        tour,tour_len=lin_kernighan(tour,dist,neighbors,lk_stats,tour_len,deadline=deadline)
+
+        end = time.time()
+        search_time=end-start
+
+        print('whole time: ', search_time)
+        print('tour_length: ', tour_len)
+        print('2-opt: ', two_opt_stats)
+        stats.add_search(two_opt_stats,'2-opt')
+        print('Lin-Kernighan: ', lk_stats)
+        stats.add_search(lk_stats,'lin-kernighan')
+
+    elif algorithm_num==9:
+        #貪欲法＋近傍リスト2_opt＋焼きなまし法（近傍リストからランダムに移動を選ぶ、時間指定）
+        print("貪欲法＋近傍リスト2_opt＋焼きなまし法(時間指定)")
+        start = time.time()
+
+        tour=nearest_neighbor(cities)
+        neighbors=neighbor_lists(cities)
+        tour,tour_len=two_opt_neighbors(tour,dist,neighbors)
+        sa_stats=SearchStats()
+        tour,tour_len=simulated_annealing(tour,dist,neighbors,limit,tour_len,sa_stats,seed)
+
+        end = time.time()
+        search_time=end-start
+
+        print('whole time: ', search_time)
+        print('tour_length: ', tour_len)
+        print('SA: ', sa_stats)
+        stats.add_search(sa_stats,'annealing')
+
+    elif algorithm_num==10:
+        #Held-Karp法（bit DP）で厳密解を求める（N<=16くらいまで）
+        print("Held-Karp法")
+        start = time.time()
+
+        try:
+            tour,tour_len=held_karp(dist)
+        except ValueError as e:
+            #メモリが足りない大きさの問題は解かない
+            print('Held-Karp法では解けません: ', e)
+            return None,time.time()-start,None
+
+        end = time.time()
+        search_time=end-start
+
+        print('whole time: ', search_time)
+        print('tour_length: ', tour_len)
+    elif algorithm_num==11:
+        #分枝限定法（1-treeの下界で枝刈り）で厳密解を求める（64都市くらいまで）
+        print("分枝限定法")
+        start = time.time()
+
+        try:
+            tour,tour_len,optimal=branch_and_bound(dist,time_limit=limit)
+        except ValueError as e:
+            #距離行列を作れない大きさの問題は解かない
+            print('分枝限定法では解けません: ', e)
+            return None,time.time()-start,None
+
+        end = time.time()
+        search_time=end-start
+
+        print('whole time: ', search_time)
+        print('tour_length: ', tour_len)
+        print('optimal: ', optimal)
     else:
         print("error in algorithm_num")
 
+    #各アルゴリズムの探索時間と最後の経路長を記録する
+    stats.add_time('search',search_time)
+    stats.record(tour_len,'search')
+
     #実験用
     return tour,search_time,tour_len
     #return tour
@@ -348,24 +487,37 @@ def solve(cities,algorithm_num):
 貪欲法のみ
 貪欲法＋2_opt
 貪欲法＋2_opt(with焼きなまし)
+貪欲法＋近傍リスト2_opt
+貪欲法＋近傍リスト2_opt＋Or-opt
+貪欲法＋近傍リスト2_opt＋Lin-Kernighan
+貪欲法＋近傍リスト2_opt＋焼きなまし法(時間指定)
+Held-Karp法
+分枝限定法
 
 時間と経路長比較
 """
 
 if __name__ == '__main__':
+    #--stats ファイル名 を付けると、段階ごとの時間や移動の回数をJSON（.csvならtraceだけCSV）で書き出す
+    stats_path = pop_option(sys.argv, '--stats')
+    #--profile[=ファイル名]でcProfileの結果を、--trace-memory[=ファイル名]で段階ごとのメモリの使い方を書き出す
+    profiler = Profiler.from_argv(sys.argv)
     assert len(sys.argv) > 2
 
-    tour = solve(read_input('input_{}.csv'.format(sys.argv[1])),int(sys.argv[2]))
-    #実験用
-    times=[]
-    tour_lengths=[]
-    for i in range(10):
-        tour,search_time,tour_len=solve(read_input('input_{}.csv'.format(sys.argv[1])),int(sys.argv[2]))
-        times.append(search_time)
-        tour_lengths.append(tour_len)
-
-    print(sum(times)/10)
-    print(sum(tour_lengths)/10)
-
+    #コマンドライン引数３には時間指定できるアルゴリズム（6～9, 11）の制限時間（秒）を入れる
+    #（省略したら6～8は局所最適解になるまで続け、9と11はDEFAULT_TIME_LIMIT秒）
+    time_limit = float(sys.argv[3]) if len(sys.argv) > 3 else None
+
+    #時間と経路長を何回か測って比べるときは benchmark.py を使う（例：python benchmark.py alg8 --repeat 10）
+    stats = SolveStats(profiler)
+    with profiler:
+        with stats.phase('load'):
+            cities = read_input('input_{}.csv'.format(sys.argv[1]))
+        tour,search_time,tour_len=solve(cities,int(sys.argv[2]),time_limit,stats)
+    print(stats)
+    if stats_path is not None:
+        stats.dump(stats_path)
+
+    #from common import dump_tour
     #with open(f'output_{sys.argv[1]}.csv', 'w') as f:
-    #            f.write(format_tour(tour) + '\n')
+    #    dump_tour(tour, f)